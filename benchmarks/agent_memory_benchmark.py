@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Compares the memory used per agent, and the construction throughput, of the 
+dictionary-based Agent and Agent_set classes and the slotted Slotted_Agent and 
+Slotted_Agent_set classes. Each class is also tested with a subclass adding 
+two attributes, as model code would. The sizes reported for the set classes 
+include the (empty) containers each set holds for its members.
+
+Usage::
+
+    python agent_memory_benchmark.py [max_agents]
+
+where max_agents defaults to 10,000,000.
+"""
+
+import sys
+import time
+
+from pyabm.agents import Agent, Agent_set, Slotted_Agent, Slotted_Agent_set
+
+class Person(Agent):
+    def __init__(self, world, ID, initial_agent=False):
+        Agent.__init__(self, world, ID, initial_agent)
+        self._age = 0
+        self._sex = 'female'
+
+class Slotted_Person(Slotted_Agent):
+    __slots__ = ('_age', '_sex')
+    def __init__(self, world, ID, initial_agent=False):
+        Slotted_Agent.__init__(self, world, ID, initial_agent)
+        self._age = 0
+        self._sex = 'female'
+
+def instance_attributes(agent):
+    "Returns the values of the attributes stored on an agent instance."
+    values = []
+    if hasattr(agent, '__dict__'):
+        values.extend(agent.__dict__.values())
+    for cls in type(agent).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if name != '__dict__' and hasattr(agent, name):
+                values.append(getattr(agent, name))
+    return values
+
+def agent_size(agent):
+    """
+    Returns the number of bytes used by an agent instance, its __dict__, and 
+    the containers (such as the member dictionary and list of an Agent_set) it 
+    holds.
+    """
+    size = sys.getsizeof(agent)
+    if hasattr(agent, '__dict__'):
+        size += sys.getsizeof(agent.__dict__)
+    for value in instance_attributes(agent):
+        if isinstance(value, (dict, list, set)):
+            size += sys.getsizeof(value)
+    return size
+
+def main(max_agents=10**7):
+    sizes = [10**p for p in xrange(5, 8) if 10**p <= max_agents]
+    classes = [Agent, Slotted_Agent, Person, Slotted_Person, Agent_set, 
+            Slotted_Agent_set]
+    print("%18s %12s %12s %18s"%("class", "num agents", "bytes/agent",
+        "agents/second"))
+    for cls in classes:
+        for n in sizes:
+            start = time.time()
+            agents = [cls(None, ID, False) for ID in xrange(n)]
+            elapsed = time.time() - start
+            print("%18s %12s %12s %18.0f"%(cls.__name__, n,
+                agent_size(agents[0]), n / elapsed))
+            del agents
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
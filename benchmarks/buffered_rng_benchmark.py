@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Compares the throughput of scalar random number draws made directly from 
+numpy.random, and from a Buffered_RNG (with and without background refills), 
+both for bare rand/randn calls and through boolean_choice, 
+draw_from_prob_dist, and calc_coefficient.
+
+Usage::
+
+    python buffered_rng_benchmark.py [num_draws]
+
+where num_draws defaults to 1,000,000.
+"""
+
+import sys
+import time
+
+from pyabm import np, boolean_choice
+from pyabm.statistics import draw_from_prob_dist, calc_coefficient
+from pyabm.random_streams import Buffered_RNG
+
+AGE_DIST = (range(0, 101, 10), [18, 20, 17, 14, 11, 8, 6, 4, 1.5, .5])
+
+def time_draws(draw, num_draws):
+    start = time.time()
+    for n in xrange(num_draws):
+        draw()
+    return time.time() - start
+
+def main(num_draws=1000000):
+    rngs = [('numpy.random', np.random),
+            ('buffered', Buffered_RNG(('benchmark', 'foreground'))),
+            ('background', Buffered_RNG(('benchmark', 'background'), 
+                background=True))]
+    tests = [('rand', lambda rng: rng.rand),
+             ('randn', lambda rng: rng.randn),
+             ('boolean_choice', lambda rng: lambda: boolean_choice(.5, rng)),
+             ('draw_prob_dist', lambda rng: lambda: draw_from_prob_dist(AGE_DIST, 
+                 rng=rng)),
+             ('calc_coef', lambda rng: lambda: calc_coefficient((.5, .1), rng))]
+    print("%16s %16s %16s"%("call", "rng", "draws/second"))
+    for test_name, make_draw in tests:
+        # draw_from_prob_dist is much slower than the other calls, so time 
+        # fewer draws.
+        if test_name == 'draw_prob_dist':
+            test_draws = num_draws // 10
+        else:
+            test_draws = num_draws
+        for rng_name, rng in rngs:
+            elapsed = time_draws(make_draw(rng), test_draws)
+            print("%16s %16s %16.0f"%(test_name, rng_name, test_draws / elapsed))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Benchmarks the per-ID cost of the IDGenerator class. The cost of allocating an 
+ID with next, reserving a block of IDs with reserve_block, and of registering 
+an externally assigned ID with use_ID should stay flat as the number of IDs 
+already in use grows.
+
+Usage::
+
+    python idgenerator_benchmark.py [max_IDs]
+
+where max_IDs defaults to 10,000,000.
+"""
+
+import sys
+import time
+
+from pyabm import IDGenerator
+
+def time_per_ID(func, n):
+    start = time.time()
+    func(n)
+    return (time.time() - start) / n
+
+def main(max_IDs=10**7):
+    sizes = [10**p for p in xrange(3, 8) if 10**p <= max_IDs]
+    print("%10s %16s %16s %16s"%("num IDs", "next (us/ID)",
+        "block (us/ID)", "use_ID (us/ID)"))
+    for n in sizes:
+        gen = IDGenerator()
+        def run_next(n):
+            for i in xrange(n):
+                gen.next()
+        next_cost = time_per_ID(run_next, n)
+
+        gen = IDGenerator()
+        block_cost = time_per_ID(gen.reserve_block, n)
+
+        gen = IDGenerator()
+        def run_use_ID(n):
+            # Register every other ID externally, the way IDs read in from 
+            # survey data are registered, then fill in the gaps with next.
+            for i in xrange(0, 2*n, 2):
+                gen.use_ID(i)
+        use_ID_cost = time_per_ID(run_use_ID, n)
+
+        print("%10s %16.3f %16.3f %16.3f"%(n, next_cost*1e6, block_cost*1e6,
+            use_ID_cost*1e6))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Compares iterating over the members of Agent_set instances of household, 
+neighborhood and region sizes by copying the members (with get_agents) and 
+without copying (with iter_agents). Reports the bytes allocated for each 
+iteration (the size of the copied list, or of the iterator), and the time 
+taken per member.
+
+Usage::
+
+    python iteration_benchmark.py
+"""
+
+import sys
+import time
+
+from pyabm.agents import Agent, Agent_set
+
+def time_per_member(func, agent_set, repeats):
+    start = time.time()
+    for n in xrange(repeats):
+        for agent in func():
+            pass
+    return (time.time() - start) / (repeats*agent_set.num_members())
+
+def main():
+    set_sizes = [5, 500, 50000]
+    print("%10s %18s %18s %18s %18s"%("set size", "copy bytes/step",
+        "iter bytes/step", "copy (ns/member)", "iter (ns/member)"))
+    for size in set_sizes:
+        agent_set = Agent_set(None, 0, False)
+        agent_set.add_agents([Agent(None, ID) for ID in xrange(size)])
+        repeats = max(10**6 // size, 10)
+        copy_bytes = sys.getsizeof(agent_set.get_agents())
+        iter_bytes = sys.getsizeof(agent_set.iter_agents())
+        copy_time = time_per_member(agent_set.get_agents, agent_set, repeats)
+        iter_time = time_per_member(agent_set.iter_agents, agent_set, repeats)
+        print("%10s %18s %18s %18.1f %18.1f"%(size, copy_bytes, iter_bytes,
+            copy_time*1e9, iter_time*1e9))
+
+if __name__ == "__main__":
+    main()
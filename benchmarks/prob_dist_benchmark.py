@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Compares the throughput of drawing values from a probability distribution one 
+at a time with draw_from_prob_dist, and in a single batch with the size 
+parameter of draw_from_prob_dist.
+
+Usage::
+
+    python prob_dist_benchmark.py [num_draws]
+
+where num_draws defaults to 500,000.
+"""
+
+import sys
+import time
+
+from pyabm import np
+from pyabm.statistics import draw_from_prob_dist
+
+# An initial age distribution (in years), with ten year bins.
+AGE_DIST = (range(0, 101, 10), [18, 20, 17, 14, 11, 8, 6, 4, 1.5, .5])
+
+def main(num_draws=500000):
+    start = time.time()
+    scalar_values = np.array([draw_from_prob_dist(AGE_DIST) for n in \
+        xrange(num_draws)])
+    scalar_time = time.time() - start
+
+    start = time.time()
+    batch_values = draw_from_prob_dist(AGE_DIST, size=num_draws)
+    batch_time = time.time() - start
+
+    print("%10s %16s %16s %12s"%("method", "draws/second", "mean", "std dev"))
+    for method, values, elapsed in [('scalar', scalar_values, scalar_time), 
+            ('batch', batch_values, batch_time)]:
+        print("%10s %16.0f %16.3f %12.3f"%(method, num_draws / elapsed,
+            values.mean(), values.std()))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -42,38 +42,212 @@ class IDGenerator(object):
     """A generator class for consecutive unique ID numbers. IDs can be assigned 
     externally by other code, and tracked in this class with the use_ID 
     function. The use_ID function will raise an error if called with an ID that has 
-    already been assigned."""
+    already been assigned.
+    
+    Used IDs are tracked in a set, and the highest ID used so far is tracked as 
+    a high-water mark, so allocating a new ID and checking for duplicates are 
+    both constant time operations (on average), regardless of the number of 
+    IDs already assigned."""
     def __init__(self):
         # Start at -1 so the first ID will be 0
         self._last_ID = -1
-        self._used_IDs = []
+        # _max_ID is the high-water mark: the largest ID assigned so far, 
+        # whether by next, reserve_block or use_ID. Every ID above _max_ID is 
+        # known to be free.
+        self._max_ID = -1
+        self._used_IDs = set()
+        # _partition_start is the first ID handed out to IDPartition instances 
+        # by partition, or None if the generator is not partitioned.
+        self._partition_start = None
 
     def reset(self):
         self.__init__()
 
+    def _check_not_partitioned(self):
+        if self._partition_start != None:
+            raise IDError("IDGenerator is partitioned - call merge before generating new IDs")
+
     def next(self):
+        self._check_not_partitioned()
         newID = self._last_ID + 1
+        # Only IDs assigned externally with use_ID can be skipped here, and 
+        # each of those can only be skipped once (as _last_ID never 
+        # decreases), so allocation is amortized constant time.
         while newID in self._used_IDs:
             newID += 1
         self._last_ID = newID
-        self._used_IDs.append(newID)
+        self._used_IDs.add(newID)
+        if newID > self._max_ID:
+            self._max_ID = newID
         return newID
 
+    def reserve_block(self, n):
+        """
+        Reserves n new IDs in a single call, and returns them as a list. If no 
+        IDs have been assigned externally above the last generated ID, the 
+        block is a run of consecutive IDs.
+        """
+        self._check_not_partitioned()
+        if n < 0:
+            raise ValueError("cannot reserve a block of %s IDs"%n)
+        start = self._last_ID + 1
+        if start > self._max_ID:
+            # All IDs above the high-water mark are free, so the block can be 
+            # reserved without checking each ID individually.
+            block = range(start, start + n)
+            self._used_IDs.update(block)
+            if n > 0:
+                self._last_ID = block[-1]
+                self._max_ID = block[-1]
+            return block
+        return [self.next() for i in xrange(n)]
+
     def use_ID(self, used_ID):
-        # TODO: This will get very slow when dealing with large numbers of IDs. 
-        # It might be better to just set _last_ID to the maximum value in 
-        # _used_IDs whenever the use_ID function is called
+        if self._partition_start != None and used_ID >= self._partition_start:
+            raise IDError("ID %s is in the ID space handed out by partition - call merge first"%(used_ID))
         if used_ID in self._used_IDs:
             raise IDError("ID %s has already been used"%(used_ID))
-        self._used_IDs.append(used_ID)
+        self._used_IDs.add(used_ID)
+        if used_ID > self._max_ID:
+            self._max_ID = used_ID
+
+    def is_used(self, ID):
+        "Returns True if ID has already been assigned."
+        return ID in self._used_IDs
+
+    def num_used(self):
+        return len(self._used_IDs)
+
+    def partition(self, num_partitions):
+        """
+        Splits the unused ID space above the high-water mark into 
+        num_partitions strided sequences, and returns a list of IDPartition 
+        instances, one per worker process. IDs generated by different 
+        partitions can never collide, so workers can create new agents without 
+        coordinating with each other.
+
+        The generator cannot generate IDs itself until the partitions are 
+        handed back to merge (at the next synchronization point).
+        """
+        self._check_not_partitioned()
+        if num_partitions < 1:
+            raise ValueError("num_partitions must be >= 1")
+        self._partition_start = self._max_ID + 1
+        return [IDPartition(self._partition_start, num_partitions, offset) \
+                for offset in xrange(num_partitions)]
 
-def boolean_choice(trueProb=.5):
+    def merge(self, partitions):
+        """
+        Merges the IDs used by a list of IDPartition instances (as returned by 
+        partition, and updated by the worker processes) back into this 
+        generator. Raises an IDError if an ID used by a partition was already 
+        used, or was also used by another of the partitions (if the same 
+        partition is passed twice, for example). All of the partitions are 
+        checked before any IDs are merged, so if an IDError is raised the 
+        generator is left unchanged (and still partitioned).
+        """
+        if self._partition_start == None:
+            raise IDError("IDGenerator is not partitioned")
+        merged_IDs = set()
+        max_ID = self._max_ID
+        for partition in partitions:
+            if partition._start != self._partition_start:
+                raise IDError("partition was not created by this IDGenerator")
+            used_IDs = partition.get_used_IDs()
+            if not self._used_IDs.isdisjoint(used_IDs):
+                raise IDError("IDs %s have already been used"%(sorted(self._used_IDs.intersection(used_IDs))))
+            if not merged_IDs.isdisjoint(used_IDs):
+                raise IDError("IDs %s were used by more than one partition"%(sorted(merged_IDs.intersection(used_IDs))))
+            merged_IDs.update(used_IDs)
+            if len(used_IDs) > 0 and used_IDs[-1] > max_ID:
+                max_ID = used_IDs[-1]
+        self._used_IDs.update(merged_IDs)
+        self._max_ID = max_ID
+        # Leave _last_ID where it was, so that gaps left between the strided 
+        # sequences are filled by later calls to next.
+        self._partition_start = None
+
+class IDPartition(object):
+    """
+    A share of the ID space of an IDGenerator, for use in a worker process. 
+    IDPartition instances are created with IDGenerator.partition, and 
+    generate the sequence::
+
+        start + offset, start + offset + stride, start + offset + 2*stride, ...
+
+    Partitions are small, picklable objects, so they can be sent to worker 
+    processes and returned to the parent process for merging.
+    """
+    def __init__(self, start, stride, offset):
+        self._start = start
+        self._stride = stride
+        self._offset = offset
+        # _num_used is the number of IDs generated so far by this partition.
+        self._num_used = 0
+
+    def next(self):
+        newID = self._start + self._offset + self._num_used*self._stride
+        self._num_used += 1
+        return newID
+
+    def reserve_block(self, n):
+        "Reserves n new IDs in a single call, and returns them as a list."
+        if n < 0:
+            raise ValueError("cannot reserve a block of %s IDs"%n)
+        first = self._start + self._offset + self._num_used*self._stride
+        self._num_used += n
+        return range(first, first + n*self._stride, self._stride)
+
+    def get_used_IDs(self):
+        "Returns a list of the IDs generated by this partition, in order."
+        first = self._start + self._offset
+        return range(first, first + self._num_used*self._stride, self._stride)
+
+    def num_used(self):
+        return self._num_used
+
+def boolean_choice(trueProb=.5, rng=None):
     """A function that returns true or false depending on whether a randomly
-    drawn float is less than trueProb"""
-    if np.random.rand() < trueProb:
+    drawn float is less than trueProb. rng is the random number generator to 
+    draw from (a RandomState, such as a stream from the random_streams module), 
+    and defaults to numpy.random."""
+    if rng == None:
+        rng = np.random
+    if rng.rand() < trueProb:
         return True
     else:
         return False
 
+def boolean_choices(trueProbs=.5, size=None, rng=None):
+    """
+    A vectorized version of boolean_choice, that returns a boolean array that 
+    is True where a randomly drawn float is less than the corresponding 
+    probability in trueProbs. trueProbs can be a single probability or an 
+    array of probabilities (for example, one for each agent). If size is given, 
+    trueProbs is broadcast to that shape.
+
+    All of the random floats are drawn in a single np.random.rand call, with 
+    one float drawn per element of the result, in C (row-major) order. Because 
+    np.random.rand(n) draws the same numbers as n successive calls to 
+    np.random.rand(), boolean_choices(probs) returns the same result (and 
+    leaves the random state in the same place) as::
+
+        [boolean_choice(prob) for prob in probs]
+
+    so replacing a loop of boolean_choice calls with a single boolean_choices 
+    call does not change the results of a model run with a given random_seed, 
+    provided no other random numbers were drawn within the loop. The same 
+    holds for the random number generator passed as rng (numpy.random by 
+    default).
+    """
+    if rng == None:
+        rng = np.random
+    trueProbs = np.asarray(trueProbs, dtype=float)
+    if size == None:
+        shape = trueProbs.shape
+    else:
+        shape = np.broadcast(trueProbs, np.empty(size, dtype=bool)).shape
+    return rng.rand(*shape) < trueProbs
+
 rc_params = rc_params_management()
 rc_params.initialize(__name__)
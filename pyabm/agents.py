@@ -25,11 +25,23 @@ households, neighborhoods, and regions all contain lower-level agents).
 
 from __future__ import division
 
-from pyabm import rc_params
+import bisect
+import heapq
+from collections import OrderedDict
+from itertools import islice, izip
+
+from pyabm import rc_params, np
+from pyabm import instrumentation
 rcParams = rc_params.get_params()
 
-class Agent(object):
-    "Class for agent objects."
+class Agent_base(object):
+    """
+    Base class defining the methods shared by Agent and Slotted_Agent. Defines 
+    an empty __slots__ so that it does not add a __dict__ to slotted 
+    subclasses.
+    """
+    __slots__ = ()
+
     def __init__(self, world, ID, initial_agent=False):
         # Keep a reference to the agent's world so that ID generators and other 
         # world properties can be easily referenced
@@ -57,23 +69,442 @@ class Agent(object):
     def get_parent_agent(self):
         return self._parent_agent
 
-class Agent_set(Agent):
+    def set_attribute(self, name, value):
+        """
+        Sets the named attribute, and updates any index (see 
+        Agent_set.add_index) or summed aggregate (see 
+        Agent_set.track_aggregate) on that attribute that is kept by the 
+        agent's parent Agent_set.
+        """
+        if isinstance(getattr(type(self), name, None), _Column_Property):
+            # The setters of column properties already update the parent's 
+            # indexes and aggregates.
+            setattr(self, name, value)
+            return
+        parent = self._parent_agent
+        aggregates = getattr(parent, '_aggregates', None)
+        old_value = None
+        if aggregates:
+            for attribute, total in aggregates.itervalues():
+                if attribute == name:
+                    old_value = getattr(self, name)
+                    break
+        setattr(self, name, value)
+        self._attribute_changed(name, old_value, value)
+
+    def _attribute_changed(self, name, old_value, value):
+        """
+        Updates the indexes and summed aggregates of the parent Agent_set 
+        after the named attribute changed from old_value to value (old_value 
+        is only used if the parent tracks a sum of the attribute).
+        """
+        parent = self._parent_agent
+        if parent == None:
+            return
+        aggregates = getattr(parent, '_aggregates', None)
+        indexes = getattr(parent, '_indexes', None)
+        if indexes and name in indexes:
+            indexes[name].update(self._ID, value)
+        if aggregates:
+            for aggregate_name, (attribute, total) in aggregates.items():
+                if attribute == name:
+                    parent.adjust_aggregate(aggregate_name, value - old_value)
+
+class Agent(Agent_base):
+    "Class for agent objects."
+
+class Slotted_Agent(Agent_base):
     """
-    Class for agents that contain a "set" of agents from a lower 
-    hierarchical  level.
+    Class for agent objects that stores the base agent attributes in 
+    __slots__ rather than in a per-instance __dict__, reducing the memory 
+    used by each agent. Subclasses should declare their own attributes in a 
+    __slots__ tuple, for example::
+
+        class Person(Slotted_Agent):
+            __slots__ = ('_age', '_sex')
+
+    or they will be given a __dict__ (and lose the memory savings). Slotted 
+    agents can only be pickled with pickle protocol 2 or higher.
+    """
+    __slots__ = ('_world', '_ID', '_initial_agent', '_parent_agent')
+
+class Column_Store(object):
+    """
+    Stores attributes of a group of agents in columns, with one typed numpy 
+    array per attribute, and one row per agent. The arrays are grown by 
+    doubling their capacity, so adding rows is amortized constant time. 
+    Removing a row moves the last row into the hole it leaves, so the live 
+    rows are always the first num_rows() rows of each array.
+
+    A Column_Store can be shared by any number of Agent_set instances (for 
+    example, one store for the person agents in all households), so that model 
+    code can update an attribute of all the agents in the store with a single 
+    vectorized numpy operation::
+
+        ages = person_store.get_column('age')
+        ages += 1
+
+    Vectorized updates bypass the indexes and summed aggregates kept by the 
+    Agent_set instances using the store, so after updating an indexed or 
+    aggregated column, call Agent_set.reindex on each of those sets.
+
+    Note that the arrays returned by get_column and get_IDs are views that are 
+    only valid until the next row is added or removed.
+    """
+    def __init__(self, columns, capacity=16):
+        """
+        columns is a dictionary of column name : numpy dtype pairs.
+        """
+        capacity = max(int(capacity), 1)
+        self._columns = {}
+        for name, dtype in columns.iteritems():
+            self._columns[name] = np.zeros(capacity, dtype=dtype)
+        self._IDs = np.zeros(capacity, dtype=np.int64)
+        # _rows maps agent IDs to row numbers
+        self._rows = {}
+        self._num_rows = 0
+
+    def _grow(self):
+        capacity = 2*len(self._IDs)
+        for name, column in self._columns.iteritems():
+            new_column = np.zeros(capacity, dtype=column.dtype)
+            new_column[:self._num_rows] = column[:self._num_rows]
+            self._columns[name] = new_column
+        new_IDs = np.zeros(capacity, dtype=self._IDs.dtype)
+        new_IDs[:self._num_rows] = self._IDs[:self._num_rows]
+        self._IDs = new_IDs
+
+    def add_row(self, ID, values):
+        """
+        Adds a row for the agent with the given ID. values is a dictionary of 
+        column name : value pairs. Columns missing from values are set to 
+        zero.
+        """
+        if ID in self._rows:
+            raise KeyError("agent %s already has a row in this Column_Store"%ID)
+        if self._num_rows == len(self._IDs):
+            self._grow()
+        row = self._num_rows
+        for name, column in self._columns.iteritems():
+            column[row] = values.get(name, 0)
+        self._IDs[row] = ID
+        self._rows[ID] = row
+        self._num_rows += 1
+        return row
+
+    def remove_row(self, ID):
+        """
+        Removes the row for the agent with the given ID, and returns the 
+        values that were stored in that row as a dictionary.
+        """
+        try:
+            row = self._rows.pop(ID)
+        except KeyError:
+            raise KeyError("agent %s does not have a row in this Column_Store"%ID)
+        last = self._num_rows - 1
+        values = {}
+        for name, column in self._columns.iteritems():
+            values[name] = column[row].item()
+            if row != last:
+                column[row] = column[last]
+        if row != last:
+            moved_ID = self._IDs[last].item()
+            self._IDs[row] = moved_ID
+            self._rows[moved_ID] = row
+        self._num_rows = last
+        return values
+
+    def get_value(self, ID, name):
+        return self._columns[name][self._rows[ID]]
+
+    def set_value(self, ID, name, value):
+        self._columns[name][self._rows[ID]] = value
+
+    def get_row(self, ID):
+        "Returns the row number of the agent with the given ID."
+        return self._rows[ID]
+
+    def get_rows(self, IDs):
+        "Returns an array of the row numbers of the agents with the given IDs."
+        rows = self._rows
+        return np.fromiter((rows[ID] for ID in IDs), dtype=np.intp)
+
+    def get_column(self, name):
+        "Returns a view of the live rows of a column."
+        return self._columns[name][:self._num_rows]
+
+    def get_IDs(self):
+        "Returns a view of the IDs of the agents stored in each live row."
+        return self._IDs[:self._num_rows]
+
+    def get_column_names(self):
+        return self._columns.keys()
+
+    def num_rows(self):
+        return self._num_rows
+
+    def __len__(self):
+        return self._num_rows
+
+    def __contains__(self, ID):
+        return ID in self._rows
+
+class _Column_Property(property):
+    "A property accessing a column of a Column_Agent (see column_property)."
+
+def column_property(name):
+    """
+    Returns a property giving access to the 'name' column of a Column_Agent. 
+    Use in the class definition of Column_Agent subclasses, for example::
+
+        class Person(Column_Agent):
+            __slots__ = ()
+            _columns = ('age', 'income')
+            age = column_property('age')
+            income = column_property('income')
+
+    Setting the property also updates any index or summed aggregate on the 
+    property kept by the agent's parent Agent_set, as set_attribute does.
+    """
+    def fget(self):
+        if self._column_store == None:
+            return self._column_values[name]
+        return self._column_store.get_value(self._ID, name)
+    def fset(self, value):
+        if self._column_store == None:
+            old_value = self._column_values[name]
+            self._column_values[name] = value
+        else:
+            old_value = self._column_store.get_value(self._ID, name)
+            self._column_store.set_value(self._ID, name, value)
+            # Use the value as stored (cast to the dtype of the column).
+            value = self._column_store.get_value(self._ID, name)
+        self._attribute_changed(name, old_value, value)
+    return _Column_Property(fget, fset)
+
+class Column_Agent(Slotted_Agent):
+    """
+    Class for agents whose attributes (those named in the _columns class 
+    attribute) are stored in the Column_Store of the Agent_set they are a 
+    member of. While the agent is a member of an Agent_set that has a 
+    Column_Store, the agent is a lightweight view of a row in that store. When 
+    the agent is not a member of such a set (for example while it is in an 
+    Agent_Store), its column values are kept in a dictionary.
+
+    Column_Agent is a Slotted_Agent, so that the view stays small: subclasses 
+    should declare any attributes not stored in columns in __slots__ (an 
+    empty tuple if there are none), for example::
+
+        class Person(Column_Agent):
+            __slots__ = ('_store_list',)
+            _columns = ('age', 'income')
+            age = column_property('age')
+            income = column_property('income')
+    """
+    __slots__ = ('_column_store', '_column_values')
+    _columns = ()
+
+    def __init__(self, world, ID, initial_agent=False, **values):
+        Slotted_Agent.__init__(self, world, ID, initial_agent)
+        self._column_store = None
+        self._column_values = dict([(name, values.get(name, 0)) for name in \
+            self._columns])
+
+    def _attach_column_store(self, store):
+        store.add_row(self._ID, self._column_values)
+        self._column_store = store
+        self._column_values = None
+
+    def _detach_column_store(self):
+        self._column_values = self._column_store.remove_row(self._ID)
+        self._column_store = None
+
+def _matches(value, criterion):
+    """
+    Tests a value against a query criterion: a (lower, upper) tuple matches 
+    values in [lower, upper), a list or set matches any of the values it 
+    contains, and any other criterion matches values equal to it.
+    """
+    if type(criterion) == tuple:
+        return criterion[0] <= value < criterion[1]
+    elif type(criterion) in (list, set, frozenset):
+        return value in criterion
+    else:
+        return value == criterion
+
+class Hash_Index(object):
+    """
+    Index of the members of an Agent_set by the value of a categorical 
+    attribute (sex, or land ownership, for example).
+    """
+    def __init__(self, attribute):
+        self._attribute = attribute
+        # _values stores the indexed value of each agent, keyed by ID
+        self._values = {}
+        # _IDs stores a set of agent IDs for each attribute value
+        self._IDs = {}
+
+    def add(self, ID, value):
+        self._values[ID] = value
+        if not value in self._IDs:
+            self._IDs[value] = set()
+        self._IDs[value].add(ID)
+
+    def remove(self, ID):
+        value = self._values.pop(ID)
+        IDs = self._IDs[value]
+        IDs.remove(ID)
+        if not IDs:
+            del self._IDs[value]
+
+    def update(self, ID, value):
+        self.remove(ID)
+        self.add(ID, value)
+
+    def lookup(self, criterion):
+        "Returns the set of IDs of the agents matching criterion."
+        if type(criterion) == tuple or type(criterion) in (list, set, frozenset):
+            IDs = set()
+            for value, value_IDs in self._IDs.iteritems():
+                if _matches(value, criterion):
+                    IDs.update(value_IDs)
+            return IDs
+        else:
+            return set(self._IDs.get(criterion, ()))
+
+class Binned_Index(object):
+    """
+    Index of the members of an Agent_set by the value of a numeric attribute 
+    (age, or income, for example). Agents are grouped into bins defined by a 
+    sorted sequence of bin edges, where bin n holds values in [bins[n-1], 
+    bins[n]). Range queries only need to check the individual values in the 
+    bins at either end of the range.
     """
-    def __init__(self, world, ID, initial_agent):
-        Agent.__init__(self, world, ID, initial_agent)
+    def __init__(self, attribute, bins):
+        self._attribute = attribute
+        self._edges = sorted(bins)
+        # _values stores the indexed value of each agent, keyed by ID
+        self._values = {}
+        # _bins stores a dictionary of ID : value pairs for each bin
+        self._bins = [{} for n in xrange(len(self._edges) + 1)]
 
-        # _members stores agent set members in a dictionary keyed by ID
+    def add(self, ID, value):
+        self._values[ID] = value
+        self._bins[bisect.bisect_right(self._edges, value)][ID] = value
+
+    def remove(self, ID):
+        value = self._values.pop(ID)
+        del self._bins[bisect.bisect_right(self._edges, value)][ID]
+
+    def update(self, ID, value):
+        self.remove(ID)
+        self.add(ID, value)
+
+    def lookup(self, criterion):
+        "Returns the set of IDs of the agents matching criterion."
+        if type(criterion) != tuple:
+            return set([ID for ID, value in self._values.iteritems() if \
+                _matches(value, criterion)])
+        lower, upper = criterion
+        if lower >= upper:
+            return set()
+        first = bisect.bisect_right(self._edges, lower)
+        last = bisect.bisect_left(self._edges, upper)
+        IDs = set([ID for ID, value in self._bins[first].iteritems() if \
+            lower <= value < upper])
+        if last > first:
+            for n in xrange(first + 1, last):
+                IDs.update(self._bins[n])
+            IDs.update([ID for ID, value in self._bins[last].iteritems() if \
+                value < upper])
+        return IDs
+
+class Agent_set_base(Agent_base):
+    """
+    Base class defining the methods shared by Agent_set and 
+    Slotted_Agent_set.
+
+    If a Column_Store is given, the members of the set must be Column_Agent 
+    instances, and their column attributes will be stored in that 
+    Column_Store while they are members of the set.
+    """
+    __slots__ = ()
+
+    # _batch_stats counts the number of batches, and the number of agents in 
+    # those batches, processed by the batch methods (add_agents, remove_agents 
+    # and transfer_agents), keyed by (class name, operation). It is shared by 
+    # all Agent_set instances.
+    _batch_stats = {}
+
+    def __init__(self, world, ID, initial_agent, column_store=None):
+        Agent_base.__init__(self, world, ID, initial_agent)
+
+        # _member_list stores the agent set members, in the order they were 
+        # added, for iteration without copying. When an agent is removed its 
+        # entry is set to None (a tombstone). The tombstones are compacted out 
+        # of the list once they make up more than half of it, but never while 
+        # the list is being iterated over by iter_agents (_num_iterators counts 
+        # the active iterators).
+        self._member_list = []
+        # _members stores the position of each member in _member_list, in a 
+        # dictionary keyed by ID
         self._members = {}
+        self._num_tombstones = 0
+        self._num_iterators = 0
+
+        # _shuffle_buffer is the index buffer reused by iter_agents_shuffled.  
+        # Its first _shuffle_size entries hold a permutation of the positions 
+        # in _member_list. _shuffle_size is set to -1 while the buffer is in 
+        # use.
+        self._shuffle_buffer = None
+        self._shuffle_size = 0
+
+        self._column_store = column_store
+
+        # _aggregates stores any aggregates (counts or sums over the members 
+        # of the set) tracked with track_aggregate, as a dictionary of 
+        # aggregate name : [attribute, value] pairs. It is None until an 
+        # aggregate is tracked.
+        self._aggregates = None
+
+        # _indexes stores any indexes added with add_index, keyed by 
+        # attribute name. It is None until an index is added.
+        self._indexes = None
 
     def get_agents(self):
-        return self._members.values()
+        "Returns a list of the members of the set, in the order they were added."
+        return [agent for agent in self._member_list if agent is not None]
+
+    def _append_members(self, agents):
+        member_list = self._member_list
+        members = self._members
+        for agent in agents:
+            members[agent._ID] = len(member_list)
+            member_list.append(agent)
+
+    def _tombstone_members(self, IDs):
+        member_list = self._member_list
+        members = self._members
+        for ID in IDs:
+            member_list[members.pop(ID)] = None
+        self._num_tombstones += len(IDs)
+        if not self._num_iterators:
+            self._compact_members()
+
+    def _compact_members(self):
+        "Removes tombstones from _member_list if they make up over half of it."
+        if self._num_tombstones*2 <= len(self._member_list):
+            return
+        self._member_list = [agent for agent in self._member_list if agent is \
+                not None]
+        members = self._members
+        for n, agent in enumerate(self._member_list):
+            members[agent._ID] = n
+        self._num_tombstones = 0
 
     def get_agent(self, ID):
         "Returns an agent given the agent's ID"
-        return self._members[ID]
+        return self._member_list[self._members[ID]]
 
     def is_member(self, ID):
         "Returns true if agent is a member of this set"
@@ -83,97 +514,615 @@ class Agent_set(Agent):
         "Adds a new agent to the set."
         if agent.get_ID() in self._members:
             raise KeyError("agent %s is already a member of agent set %s"%(agent.get_ID(), self._ID))
-        self._members[agent.get_ID()] = agent
+        deltas, index_values = self._member_values([agent])
+        self._append_members([agent])
+        if self._column_store != None:
+            agent._attach_column_store(self._column_store)
+        if deltas:
+            self._update_aggregates(deltas, 1)
+        if index_values:
+            self._index_agents([agent], index_values)
+        if instrumentation.counters is not None:
+            instrumentation.counters.count(type(self).__name__, 'add')
         # Set the agent's _parent_agent to reflect the parent of this Agent_set 
         # instance (self)
         agent.set_parent_agent(self)
 
     def remove_agent(self, agent):
         "Removes agent from agent set."
-        try:
-            self._members.pop(agent.get_ID())
-        except KeyError:
+        if not agent.get_ID() in self._members:
             raise KeyError("agent %s is not a member of agent set %s"%(agent.get_ID(), self.get_ID()))
+        deltas, index_values = self._member_values([agent])
+        self._tombstone_members([agent.get_ID()])
         # Reset the agent's _parent_agent
         assert agent.get_parent_agent().get_ID() == self.get_ID(), "Removing agent from an Agent_set it does not appear to be assigned to."
+        if self._column_store != None:
+            agent._detach_column_store()
+        if deltas:
+            self._update_aggregates(deltas, -1)
+        if self._indexes:
+            self._unindex_agents([agent])
+        if instrumentation.counters is not None:
+            instrumentation.counters.count(type(self).__name__, 'remove')
         agent.set_parent_agent(None)
 
+    def _record_batch(self, operation, num_agents):
+        key = (type(self).__name__, operation)
+        stats = self._batch_stats.get(key)
+        if stats == None:
+            stats = self._batch_stats[key] = [0, 0]
+        stats[0] += 1
+        stats[1] += num_agents
+
+    @classmethod
+    def get_batch_stats(cls):
+        """
+        Returns a dictionary, keyed by (class name, operation), of [number of 
+        batches, number of agents] processed by the batch methods of all 
+        Agent_set instances.
+        """
+        return dict([(key, list(value)) for key, value in \
+            cls._batch_stats.iteritems()])
+
+    @classmethod
+    def reset_batch_stats(cls):
+        Agent_set_base._batch_stats.clear()
+
+    def _check_new_members(self, agents):
+        """
+        Checks a batch of agents can be added to this set. Returns the values 
+        the agents contribute to the aggregates and indexes of this set (see 
+        _member_values), which are read before the set is changed so that a 
+        batch that cannot be added leaves the set untouched.
+        """
+        new_IDs = set([agent.get_ID() for agent in agents])
+        if len(new_IDs) != len(agents):
+            raise KeyError("batch of agents for agent set %s contains duplicate IDs"%self._ID)
+        duplicates = self._members.viewkeys() & new_IDs
+        if duplicates:
+            raise KeyError("agents %s are already members of agent set %s"%(sorted(duplicates), self._ID))
+        return self._member_values(agents)
+
+    def _check_members(self, IDs):
+        "Checks that a batch of agent IDs are all members of this set."
+        if len(set(IDs)) != len(IDs):
+            raise KeyError("batch of agent IDs for agent set %s contains duplicates"%self._ID)
+        missing = [ID for ID in IDs if not ID in self._members]
+        if missing:
+            raise KeyError("agents %s are not members of agent set %s"%(missing, self._ID))
+
+    def _member_values(self, agents):
+        """
+        Returns a dictionary of the total contribution of a batch of agents to 
+        each aggregate of this set, and a dictionary of lists of the values 
+        of each indexed attribute for the agents. Either is None if the set 
+        has no aggregates or indexes.
+        """
+        deltas = None
+        if self._aggregates:
+            deltas = {}
+            for name, (attribute, value) in self._aggregates.iteritems():
+                delta = 0
+                for agent in agents:
+                    delta += self._aggregate_contribution(agent, name, attribute)
+                deltas[name] = delta
+        index_values = None
+        if self._indexes:
+            index_values = dict([(attribute, [getattr(agent, attribute) for \
+                agent in agents]) for attribute in self._indexes])
+        return deltas, index_values
+
+    def _pop_members(self, IDs, detach):
+        agents = [self.get_agent(ID) for ID in IDs]
+        deltas = self._member_values(agents)[0]
+        self._tombstone_members(IDs)
+        assert all([agent._parent_agent is self for agent in agents]), "Removing agents from an Agent_set they do not appear to be assigned to."
+        if detach and self._column_store != None:
+            for agent in agents:
+                agent._detach_column_store()
+        if deltas:
+            self._update_aggregates(deltas, -1)
+        if self._indexes:
+            self._unindex_agents(agents)
+        if instrumentation.counters is not None:
+            instrumentation.counters.count(type(self).__name__, 'remove', len(agents))
+        for agent in agents:
+            agent._parent_agent = None
+        return agents
+
+    def _push_members(self, agents, member_values, attach):
+        deltas, index_values = member_values
+        self._append_members(agents)
+        if attach and self._column_store != None:
+            for agent in agents:
+                agent._attach_column_store(self._column_store)
+        if deltas:
+            self._update_aggregates(deltas, 1)
+        if index_values:
+            self._index_agents(agents, index_values)
+        if instrumentation.counters is not None:
+            instrumentation.counters.count(type(self).__name__, 'add', len(agents))
+        for agent in agents:
+            agent._parent_agent = self
+
+    def add_agents(self, agents):
+        """
+        Adds a batch of agents to the set. The batch is validated as a whole 
+        before any agent is added. Note that the parent agent links are set 
+        directly, without calling set_parent_agent. Returns the number of 
+        agents added.
+        """
+        agents = list(agents)
+        member_values = self._check_new_members(agents)
+        self._push_members(agents, member_values, True)
+        self._record_batch('add', len(agents))
+        return len(agents)
+
+    def remove_agents(self, IDs):
+        """
+        Removes a batch of agents, given by ID, from the set. The batch is 
+        validated as a whole before any agent is removed. Returns a list of 
+        the removed agents.
+        """
+        IDs = list(IDs)
+        self._check_members(IDs)
+        agents = self._pop_members(IDs, True)
+        self._record_batch('remove', len(agents))
+        return agents
+
+    def transfer_agents(self, IDs, dest_set):
+        """
+        Moves a batch of agents, given by ID, from this set to dest_set (for 
+        example when agents migrate, or when households split). The batch is 
+        validated against both sets before any agent is moved. If both sets 
+        share the same Column_Store, the agents' rows are left in place. 
+        Returns a list of the moved agents.
+        """
+        IDs = list(IDs)
+        self._check_members(IDs)
+        agents = [self.get_agent(ID) for ID in IDs]
+        member_values = dest_set._check_new_members(agents)
+        same_store = self._column_store is dest_set._column_store
+        self._pop_members(IDs, not same_store)
+        dest_set._push_members(agents, member_values, not same_store)
+        self._record_batch('transfer', len(agents))
+        return agents
+
     def iter_agents(self):
-        for agent in self.get_agents():
-            yield agent
+        """
+        Iterates over the members of the set, in the order they were added, 
+        without copying the set. The set can be modified during iteration: 
+        members removed during iteration are not yielded (if they have not 
+        been already), and members added during iteration are not yielded.
+        """
+        member_list = self._member_list
+        self._num_iterators += 1
+        try:
+            for agent in islice(member_list, len(member_list)):
+                if agent is not None:
+                    yield agent
+        finally:
+            self._num_iterators -= 1
+            if not self._num_iterators:
+                self._compact_members()
+
+    def iter_agents_shuffled(self, rng=None):
+        """
+        Iterates over the members of the set in a random order, drawn afresh 
+        on each call. rng is the random number generator used to permute the 
+        order (a numpy RandomState, or the numpy.random module, which is used 
+        by default and is seeded by the random_seed rc parameter).
+
+        The order is generated by permuting, in place, an index buffer kept by 
+        the set, so that a new list does not have to be allocated each 
+        timestep. The set can be modified during iteration, as for 
+        iter_agents.
+        """
+        if rng is None:
+            rng = np.random
+        member_list = self._member_list
+        n = len(member_list)
+        buffer = self._shuffle_buffer
+        size = self._shuffle_size
+        if size < 0:
+            # The buffer is in use by another shuffled iteration over this 
+            # set, so use a temporary permutation.
+            buffer = None
+            order = rng.permutation(n)
+        else:
+            if buffer is None or len(buffer) < n:
+                new_buffer = np.empty(max(n, 2*size), dtype=np.intp)
+                if buffer is not None:
+                    new_buffer[:size] = buffer[:size]
+                buffer = self._shuffle_buffer = new_buffer
+            # Any permutation of the positions in _member_list can be 
+            # shuffled to give a new random order, so the buffer only needs to 
+            # be refilled when the length of _member_list changes.
+            if n < size:
+                buffer[:n] = np.arange(n)
+            elif n > size:
+                buffer[size:n] = np.arange(size, n)
+            order = buffer[:n]
+            rng.shuffle(order)
+            self._shuffle_size = -1
+        self._num_iterators += 1
+        try:
+            for position in order:
+                agent = member_list[position]
+                if agent is not None:
+                    yield agent
+        finally:
+            if buffer is not None:
+                self._shuffle_size = n
+            self._num_iterators -= 1
+            if not self._num_iterators:
+                self._compact_members()
 
     def num_members(self):
         return len(self._members)
 
+    def track_aggregate(self, name, attribute=None):
+        """
+        Starts incrementally tracking an aggregate over the members of this 
+        set. If attribute is None, the aggregate is a count of the members, 
+        otherwise it is the sum of the named attribute over the members. If a 
+        member is itself an Agent_set tracking an aggregate of the same name, 
+        the value of that member's aggregate is used instead, so that, for 
+        example, if households, neighborhoods and regions all track a 
+        'population' aggregate, the population of a region is the number of 
+        person agents in it::
+
+            household.track_aggregate('population')
+            neighborhood.track_aggregate('population')
+            region.track_aggregate('population')
+
+        The aggregate is then updated by add_agent, remove_agent and the batch 
+        methods, and changes are propagated up the chain of parent agents 
+        tracking the same aggregate, so that get_aggregate is a constant time 
+        read. Aggregates should be tracked starting from the lowest level of 
+        the hierarchy, before the sets are added to their parents. If the 
+        value of a summed attribute changes, call adjust_aggregate on the 
+        agent's parent with the change in value.
+        """
+        if self._aggregates == None:
+            self._aggregates = {}
+        value = 0
+        for agent in self.iter_agents():
+            value += self._aggregate_contribution(agent, name, attribute)
+        self._aggregates[name] = [attribute, value]
+
+    def untrack_aggregate(self, name):
+        del self._aggregates[name]
+
+    def get_aggregate(self, name):
+        return self._aggregates[name][1]
+
+    def is_tracking_aggregate(self, name):
+        return self._aggregates != None and name in self._aggregates
+
+    @staticmethod
+    def _aggregate_contribution(agent, name, attribute):
+        aggregates = getattr(agent, '_aggregates', None)
+        if aggregates and name in aggregates:
+            return aggregates[name][1]
+        elif attribute == None:
+            return 1
+        else:
+            return getattr(agent, attribute)
+
+    def _update_aggregates(self, deltas, sign):
+        """
+        Adds (sign=1) or subtracts (sign=-1) the contributions of a batch of 
+        agents, as returned by _member_values, from the aggregates.
+        """
+        for name, delta in deltas.iteritems():
+            self.adjust_aggregate(name, sign*delta)
+
+    def adjust_aggregate(self, name, delta):
+        """
+        Adds delta to the named aggregate of this set, and of each parent 
+        agent up the hierarchy that tracks the same aggregate.
+        """
+        agent_set = self
+        while agent_set != None:
+            aggregates = getattr(agent_set, '_aggregates', None)
+            if not aggregates or not name in aggregates:
+                break
+            aggregates[name][1] += delta
+            agent_set = agent_set._parent_agent
+
+    def add_index(self, attribute, bins=None):
+        """
+        Adds an index on the named attribute of the members of this set, for 
+        use by query. If bins is None, a Hash_Index is used (for categorical 
+        attributes). Otherwise bins should be a sequence of bin edges, and a 
+        Binned_Index is used (for numeric attributes).
+
+        The index is kept up to date by add_agent, remove_agent and the batch 
+        methods. Changes to the indexed attribute of a member must be made 
+        with Agent.set_attribute for the index to remain consistent.
+        """
+        if self._indexes == None:
+            self._indexes = {}
+        if bins == None:
+            index = Hash_Index(attribute)
+        else:
+            index = Binned_Index(attribute, bins)
+        for agent in self.iter_agents():
+            index.add(agent._ID, getattr(agent, attribute))
+        self._indexes[attribute] = index
+
+    def reindex(self, attributes=None):
+        """
+        Rebuilds the indexes, and recalculates the summed aggregates, on the 
+        given list of attributes (or on all attributes, if attributes is None) 
+        from the current attribute values of the members of this set. Use 
+        after member attributes are changed without set_attribute, such as by 
+        a vectorized update of a Column_Store column. The aggregate changes 
+        are propagated up the hierarchy. If member sets also track the 
+        aggregates, reindex them first.
+        """
+        if self._indexes:
+            for attribute, index in self._indexes.iteritems():
+                if attributes == None or attribute in attributes:
+                    for agent in self.iter_agents():
+                        index.update(agent._ID, getattr(agent, attribute))
+        if self._aggregates:
+            for name, (attribute, total) in self._aggregates.items():
+                if attribute == None or (attributes != None and not attribute 
+                        in attributes):
+                    continue
+                new_total = 0
+                for agent in self.iter_agents():
+                    new_total += self._aggregate_contribution(agent, name, 
+                            attribute)
+                self.adjust_aggregate(name, new_total - total)
+
+    def remove_index(self, attribute):
+        del self._indexes[attribute]
+
+    def _index_agents(self, agents, index_values):
+        for attribute, index in self._indexes.iteritems():
+            for agent, value in izip(agents, index_values[attribute]):
+                index.add(agent._ID, value)
+
+    def _unindex_agents(self, agents):
+        for index in self._indexes.itervalues():
+            for agent in agents:
+                index.remove(agent._ID)
+
+    def query(self, **criteria):
+        """
+        Returns a list of the members of this set (ordered by ID) matching all 
+        of the given attribute criteria. A (lower, upper) tuple matches values 
+        in [lower, upper), a list or set matches any of the values it contains, 
+        and any other value is matched exactly. For example::
+
+            household.query(_sex='female', _age=(15*12, 45*12))
+
+        Criteria on indexed attributes (see add_index) are resolved using the 
+        indexes. Only if no criteria are on indexed attributes are all the 
+        members of the set scanned.
+        """
+        indexes = self._indexes or {}
+        matches = [indexes[attribute].lookup(criterion) for attribute, \
+                criterion in criteria.iteritems() if attribute in indexes]
+        if matches:
+            matches.sort(key=len)
+            IDs = matches[0].intersection(*matches[1:])
+        else:
+            IDs = self._members.iterkeys()
+        unindexed = [(attribute, criterion) for attribute, criterion in \
+                criteria.iteritems() if not attribute in indexes]
+        members = self._members
+        member_list = self._member_list
+        agents = []
+        for ID in sorted(IDs):
+            agent = member_list[members[ID]]
+            for attribute, criterion in unindexed:
+                if not _matches(getattr(agent, attribute), criterion):
+                    break
+            else:
+                agents.append(agent)
+        return agents
+
+    def get_column_store(self):
+        return self._column_store
+
+    def get_column(self, name):
+        """
+        Returns an array of the values of the 'name' column for the members of 
+        this set, in the order they were added (the order of the IDs returned 
+        by get_column_IDs). For vectorized updates over all the agents sharing 
+        a Column_Store, use the get_column method of the Column_Store 
+        directly.
+        """
+        rows = self._column_store.get_rows(self._iter_member_IDs())
+        return self._column_store.get_column(name)[rows]
+
+    def get_column_IDs(self):
+        return np.fromiter(self._iter_member_IDs(), dtype=np.int64)
+
+    def _iter_member_IDs(self):
+        return (agent._ID for agent in self._member_list if agent is not None)
+
+class Agent_set(Agent_set_base, Agent):
+    """
+    Class for agents that contain a "set" of agents from a lower 
+    hierarchical  level.
+    """
+
+class Slotted_Agent_set(Agent_set_base, Slotted_Agent):
+    """
+    Class for agents that contain a "set" of agents from a lower hierarchical 
+    level, with attributes stored in __slots__ (see Slotted_Agent).
+    """
+    __slots__ = ('_members', '_member_list', '_num_tombstones', 
+            '_num_iterators', '_shuffle_buffer', '_shuffle_size', 
+            '_column_store', '_aggregates', '_indexes')
+
 class Agent_Store(object):
     """
     Agent_Store is a class used to store agents who have left for various 
     reasons (such as migration) or are in school. It allows triggering their 
     return or graduation during a later timestep of the model.
+
+    Membership is tracked in a dictionary, and the release times are kept in 
+    a min-heap, so checking whether an agent is in the store, removing an 
+    agent from the store, and finding the next release time do not require 
+    scanning the stored agents.
+
+    When agents are released, release_agents counts the released agents by 
+    the ID of one of their ancestors. count_level sets which ancestor is used: 
+    1 counts by the parent agent the agent is returned to, 2 by the parent of 
+    that agent, and so on. The default of 2 counts person agents by 
+    neighborhood (person -> household -> neighborhood).
     """
-    def __init__(self):
+    def __init__(self, count_level=2):
         # self._releases is a dictionary, keyed by timestep, that stores the 
-        # time at which each agent will be released back to their original 
-        # parent agent (when they return from school, or from their temporary 
-        # migration, for example.
+        # agents that will be released back to their original parent agent at 
+        # each timestep (when they return from school, or from their temporary 
+        # migration, for example). The agents for each timestep are stored 
+        # (as keys) in an OrderedDict, so they can be removed in constant time 
+        # while still being released in the order in which they were stored.
         self._releases = {}
+        # self._release_heap is a min-heap of the timesteps in self._releases.  
+        # Timesteps are removed from the heap lazily, so it may also contain 
+        # timesteps that no longer have any agents to release.
+        self._release_heap = []
+        # self._release_times stores the release time of each agent in the 
+        # store, keyed by agent.
+        self._release_times = {}
         self._parent_dict = {}
-        self._stored_agents = []
+        if count_level < 1:
+            raise ValueError("count_level must be >= 1")
+        self._count_level = count_level
 
     def add_agent(self, agent, release_time):
         """
         Adds a new agent to the agent store. Also remove the agent from it's 
         parent Agent_set instance.
         """
-        if release_time in self._releases:
-            self._releases[release_time].append(agent)
-        else:
-            self._releases[release_time] = [agent]
+        if agent in self._release_times:
+            raise KeyError("agent %s is already in this Agent_Store"%agent.get_ID())
+        if not release_time in self._releases:
+            self._releases[release_time] = OrderedDict()
+            heapq.heappush(self._release_heap, release_time)
+        self._releases[release_time][agent] = None
+        self._release_times[agent] = release_time
         self._parent_dict[agent] = agent.get_parent_agent()
         # Store a reference to the agent store with the class instance that is 
         # being stored, for easy retrieval later
         agent._store_list.append(self)
         agent.get_parent_agent().remove_agent(agent)
-        # Keep a list of the agents stored in this agent_set instance in 
-        # _stored_agents so that we can easily check whether or now an agent is 
-        # in an agent store instance, without having to iterate through all the 
-        # release times.
-        self._stored_agents.append(agent)
+        if instrumentation.counters is not None:
+            self._count('store', 1)
+
+    def _count(self, operation, num_agents):
+        counters = instrumentation.counters
+        class_name = type(self).__name__
+        counters.count(class_name, operation, num_agents)
+        counters.record_occupancy(class_name, self, len(self._release_times))
+
+    def _count_agent(self, released_agents_dict, parent_agent):
+        "Adds one to the count for the ancestor of a released agent."
+        ancestor = parent_agent
+        for n in xrange(self._count_level - 1):
+            if ancestor == None:
+                break
+            ancestor = ancestor.get_parent_agent()
+        if ancestor == None:
+            ancestor_ID = None
+        else:
+            ancestor_ID = ancestor.get_ID()
+        if not ancestor_ID in released_agents_dict:
+            released_agents_dict[ancestor_ID] = 0
+        released_agents_dict[ancestor_ID] += 1
+
+    def _release_time(self, time, released_agents_dict, released_agents):
+        agents = self._releases.pop(time)
+        for agent in agents:
+            del self._release_times[agent]
+            parent_agent = self._parent_dict.pop(agent)
+            parent_agent.add_agent(agent)
+            agent._store_list.remove(self)
+            self._count_agent(released_agents_dict, parent_agent)
+            released_agents.append(agent)
+        if instrumentation.counters is not None:
+            self._count('release', len(agents))
 
     def release_agents(self, time):
-        # TODO: Make this more general, so it works for households or person 
-        # agents. Right now it only works for persons since to get the 
-        # neighborhood ID for tracking we have to call .get_parent_agent twice.
+        """
+        Releases the agents due to be released at 'time' back to their 
+        original parent agents. Returns a tuple of a dictionary of the number 
+        of agents released, keyed by ancestor ID (see count_level), and a list 
+        of the released agents.
+        """
         released_agents = []
         released_agents_dict = {}
         if time in self._releases:
-            for agent in self._releases[time]:
-                parent_agent = self._parent_dict.pop(agent)
-                parent_agent.add_agent(agent)
-                agent._store_list.remove(self)
-                self._stored_agents.remove(agent)
-                neighborhood = parent_agent.get_parent_agent()
-                if not neighborhood.get_ID() in released_agents_dict:
-                    released_agents_dict[neighborhood.get_ID()] = 0
-                released_agents_dict[neighborhood.get_ID()] += 1
-                released_agents.append(agent)
-            # Remove the now unused releases list for this timestep.
-            self._releases.pop(time)
+            self._release_time(time, released_agents_dict, released_agents)
+        return released_agents_dict, released_agents
+
+    def release_until(self, time):
+        """
+        Releases all agents with release times less than or equal to 'time', 
+        in order of release time. Returns a tuple of a dictionary and a list, 
+        as for release_agents.
+        """
+        released_agents = []
+        released_agents_dict = {}
+        while True:
+            next_release = self.peek_next_release()
+            if next_release == None or next_release > time:
+                break
+            heapq.heappop(self._release_heap)
+            self._release_time(next_release, released_agents_dict, released_agents)
         return released_agents_dict, released_agents
 
+    def peek_next_release(self):
+        """
+        Returns the earliest time at which agents are due to be released, or 
+        None if the store is empty.
+        """
+        heap = self._release_heap
+        # Discard any timesteps that no longer have agents to release.
+        while heap and not heap[0] in self._releases:
+            heapq.heappop(heap)
+        if heap:
+            return heap[0]
+        else:
+            return None
+
     def in_store(self, agent):
-        if agent in self._stored_agents: return True
-        else: return False
+        return agent in self._release_times
+
+    def get_release_time(self, agent):
+        return self._release_times[agent]
+
+    def num_stored(self):
+        return len(self._release_times)
 
     def remove_agent(self, agent):
         """
         Remove an agent from the store without releasing it to its original 
         location (useful for handling agents who die while away from home).
         """
-        self._releases[agent._return_timestep].remove(agent)
+        try:
+            release_time = self._release_times.pop(agent)
+        except KeyError:
+            raise KeyError("agent %s is not in this Agent_Store"%agent.get_ID())
+        agents = self._releases[release_time]
+        del agents[agent]
+        if not agents:
+            # Leave the release time in the heap - it will be discarded by 
+            # peek_next_release.
+            del self._releases[release_time]
         self._parent_dict.pop(agent)
-        self._stored_agents.remove(agent)
         agent._store_list.remove(self)
+        if instrumentation.counters is not None:
+            self._count('store_remove', 1)
 
     def __str__(self):
-        return 'Agent_Store(%s)'%self._releases
+        return 'Agent_Store(%s)'%dict([(time, agents.keys()) for time, agents \
+            in self._releases.iteritems()])
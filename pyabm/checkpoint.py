@@ -0,0 +1,256 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Contains functions to save checkpoints of a model run (the agent hierarchy, 
+Agent_Store release queues, the TimeSteps position, IDGenerator states and the 
+random number generator state) to a compact binary file, and to restore a run 
+from a checkpoint.
+
+Rather than pickling the agent hierarchy as a single object graph (which 
+recurses through the parent, member and world back-references), each agent is 
+pickled separately, with references to other agents (and to the model world) 
+stored as small persistent IDs. Large numpy arrays (such as Column_Store 
+columns) are written uncompressed after the pickled data, and are memory-mapped 
+(copy-on-write) when the checkpoint is loaded.
+
+The checkpoint file layout is::
+
+    magic string | pickled agents and run state | numpy array data | 
+    pickled array table | offset of the array table (8 bytes)
+"""
+
+import os
+import struct
+import cPickle
+import tempfile
+
+from pyabm import np
+from pyabm import random_streams
+
+MAGIC = 'PYABMCK1'
+
+# Arrays of at least this many bytes are written outside the pickled data, so 
+# that they can be memory-mapped when loaded.
+ARRAY_THRESHOLD = 4096
+
+# Array data is aligned to this number of bytes in the checkpoint file.
+ALIGNMENT = 64
+
+class CheckpointError(Exception):
+    pass
+
+def _get_state(agent):
+    """
+    Returns a dictionary of the attributes of an agent, including attributes 
+    stored in __slots__.
+    """
+    state = dict(getattr(agent, '__dict__', {}))
+    for cls in type(agent).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if not name in state and hasattr(agent, name):
+                state[name] = getattr(agent, name)
+    return state
+
+def _set_state(agent, state):
+    for name, value in state.iteritems():
+        setattr(agent, name, value)
+
+def _walk_agents(roots, stores):
+    """
+    Returns a list of all the agents in the hierarchies below the root agents 
+    (in member order), and of the agents in the stores.
+    """
+    agents = []
+    seen = set()
+    pending = list(reversed(roots))
+    for store in stores:
+        pending.extend(reversed(store._release_times.keys()))
+    while pending:
+        agent = pending.pop()
+        if id(agent) in seen:
+            continue
+        seen.add(id(agent))
+        agents.append(agent)
+        member_list = getattr(agent, '_member_list', None)
+        if member_list:
+            pending.extend(reversed([member for member in member_list if \
+                member is not None]))
+    return agents
+
+class _Checkpoint_Pickler(object):
+    def __init__(self, out_file, agents, world):
+        self._pickler = cPickle.Pickler(out_file, cPickle.HIGHEST_PROTOCOL)
+        self._pickler.persistent_id = self._persistent_id
+        self._agent_indices = dict([(id(agent), n) for n, agent in \
+            enumerate(agents)])
+        self._world = world
+        # _arrays stores the large arrays found while pickling, to be written 
+        # after the pickled data.
+        self._arrays = []
+
+    def _persistent_id(self, obj):
+        if self._world is not None and obj is self._world:
+            return ('world',)
+        n = self._agent_indices.get(id(obj))
+        if n != None:
+            return ('agent', n, type(obj))
+        if isinstance(obj, np.ndarray) and obj.nbytes >= ARRAY_THRESHOLD:
+            self._arrays.append(np.ascontiguousarray(obj))
+            return ('array', len(self._arrays) - 1)
+        return None
+
+    def dump(self, obj):
+        self._pickler.dump(obj)
+
+class _Checkpoint_Unpickler(object):
+    def __init__(self, in_file, filename, array_table, world):
+        self._unpickler = cPickle.Unpickler(in_file)
+        self._unpickler.persistent_load = self._persistent_load
+        self._filename = filename
+        self._array_table = array_table
+        self._world = world
+        self._agents = {}
+
+    def get_agent(self, n, cls):
+        agent = self._agents.get(n)
+        if agent is None:
+            agent = self._agents[n] = cls.__new__(cls)
+        return agent
+
+    def _persistent_load(self, pid):
+        if pid[0] == 'agent':
+            return self.get_agent(pid[1], pid[2])
+        elif pid[0] == 'array':
+            offset, dtype, shape = self._array_table[pid[1]]
+            if np.prod(shape) == 0:
+                return np.zeros(shape, dtype=dtype)
+            return np.memmap(self._filename, dtype=dtype, mode='c', 
+                    offset=offset, shape=shape)
+        elif pid[0] == 'world':
+            return self._world
+        else:
+            raise CheckpointError("unknown persistent ID %s"%(pid,))
+
+    def load(self):
+        return self._unpickler.load()
+
+def save_checkpoint(filename, roots, time_steps=None, stores=(), 
+        id_generators=None, world=None, extra=None):
+    """
+    Saves a checkpoint to filename. roots is a list of the top-level agents 
+    of the agent hierarchy (regions, for example), stores a list of any 
+    Agent_Store instances, time_steps the TimeSteps instance of the run, and 
+    id_generators a dictionary of the IDGenerator instances of the run. 
+    References to the model world (the world parameter) are not saved - the 
+    world is instead supplied again to load_checkpoint. extra can be any other 
+    picklable model state (references within it to agents are preserved).
+
+    The state of the numpy.random random number generator, and of the streams 
+    of the random_streams module, are also saved.
+
+    The checkpoint is written to a temporary file in the same directory, which 
+    is then renamed to filename. A run resumed from a checkpoint (whose 
+    arrays are memory-mapped from the checkpoint file) can therefore save a 
+    new checkpoint to the same filename: the arrays stay mapped to the old 
+    file, which is only deleted once they are no longer in use. (On Windows, 
+    the file cannot be replaced while arrays loaded from it are in use.)
+    """
+    stores = list(stores)
+    agents = _walk_agents(list(roots), stores)
+    fd, temp_filename = tempfile.mkstemp(prefix='.checkpoint', 
+            dir=os.path.dirname(os.path.abspath(filename)))
+    out_file = os.fdopen(fd, 'wb')
+    try:
+        # mkstemp creates files readable only by their owner, so give the 
+        # checkpoint the permissions a newly created file would have.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_filename, 0666 & ~umask)
+        _write_checkpoint(out_file, roots, time_steps, stores, id_generators, 
+                world, extra, agents)
+        out_file.close()
+        if os.name == 'nt' and os.path.exists(filename):
+            # os.rename cannot replace an existing file on Windows.
+            os.remove(filename)
+        os.rename(temp_filename, filename)
+    except:
+        out_file.close()
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+def _write_checkpoint(out_file, roots, time_steps, stores, id_generators, 
+        world, extra, agents):
+    "Writes the checkpoint data for save_checkpoint to out_file."
+    out_file.write(MAGIC)
+    pickler = _Checkpoint_Pickler(out_file, agents, world)
+    pickler.dump(len(agents))
+    for agent in agents:
+        pickler.dump((type(agent), _get_state(agent)))
+    pickler.dump({'roots': list(roots),
+                  'stores': stores,
+                  'time_steps': time_steps,
+                  'id_generators': id_generators,
+                  'rng_state': np.random.get_state(),
+                  'stream_states': random_streams.get_stream_states(),
+                  'extra': extra})
+    array_table = []
+    for array in pickler._arrays:
+        offset = out_file.tell()
+        offset += -offset % ALIGNMENT
+        out_file.seek(offset)
+        out_file.write(array.tostring())
+        array_table.append((offset, array.dtype.str, array.shape))
+    table_offset = out_file.tell()
+    cPickle.dump(array_table, out_file, cPickle.HIGHEST_PROTOCOL)
+    out_file.write(struct.pack('<Q', table_offset))
+
+def load_checkpoint(filename, world=None, restore_rng=True):
+    """
+    Loads a checkpoint saved with save_checkpoint. Returns a dictionary with 
+    keys 'roots', 'stores', 'time_steps', 'id_generators', and 'extra', 
+    holding the restored objects. world is the model world object that will be 
+    referenced by the restored agents. If restore_rng is True, the state of 
+    the numpy.random random number generator and of the random_streams 
+    streams is restored, so that the run continues exactly as it would have 
+    without interruption.
+    """
+    in_file = open(filename, 'rb')
+    try:
+        if in_file.read(len(MAGIC)) != MAGIC:
+            raise CheckpointError("%s is not a pyabm checkpoint file"%filename)
+        in_file.seek(-8, os.SEEK_END)
+        table_offset = struct.unpack('<Q', in_file.read(8))[0]
+        in_file.seek(table_offset)
+        array_table = cPickle.load(in_file)
+        in_file.seek(len(MAGIC))
+        unpickler = _Checkpoint_Unpickler(in_file, filename, array_table, world)
+        num_agents = unpickler.load()
+        for n in xrange(num_agents):
+            cls, state = unpickler.load()
+            _set_state(unpickler.get_agent(n, cls), state)
+        run_state = unpickler.load()
+    finally:
+        in_file.close()
+    rng_state = run_state.pop('rng_state')
+    stream_states = run_state.pop('stream_states')
+    if restore_rng:
+        np.random.set_state(rng_state)
+        random_streams.set_stream_states(stream_states)
+    return run_state
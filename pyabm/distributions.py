@@ -0,0 +1,317 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Contains classes representing probability distributions and probability 
+tables specified in rc parameters, compiled into numpy arrays once (when the 
+rc parameters are validated) so that they do not need to be recalculated each 
+time they are used.
+
+This module only depends on numpy, so that it can be used by rcsetup.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+class Prob_Dist(tuple):
+    """
+    An immutable probability distribution, specified by bin limits and the 
+    probabilities assigned to each bin::
+
+        Prob_Dist([a, b, c, d], [1, 2, 3])
+
+    where a, b, c, and d are bin limits, and 1, 2, and 3 are the probabilities 
+    assigned to each bin. Notice one more bin limit must be specified than the 
+    number of probabilities given (to close the interval).
+
+    A Prob_Dist is a length two (binlims, probs) tuple, so it can be used 
+    anywhere the tuple form of a probability distribution is expected. The 
+    bin limits, probabilities, and the normalized cumulative distribution 
+    function at the bin limits are also stored as (read-only) numpy arrays.
+    """
+    def __new__(cls, binlims, probs):
+        binlims = tuple(np.atleast_1d(binlims).tolist())
+        probs = tuple(np.atleast_1d(probs).tolist())
+        self = tuple.__new__(cls, (binlims, probs))
+        if len(binlims) != len(probs) + 1:
+            raise ValueError("Length of probability tuple must be 1 less than the length of the bin limit tuple")
+        binlims_array = np.array(binlims, dtype=float)
+        probs_array = np.array(probs, dtype=float)
+        if np.any(np.diff(binlims_array) < 0):
+            raise ValueError("bin limits must be in increasing order")
+        if np.any(probs_array < 0):
+            raise ValueError("probabilities must be >= 0")
+        probcumsums = np.cumsum(probs_array)
+        if probcumsums[-1] <= 0:
+            raise ValueError("probabilities must sum to a value > 0")
+        cdf = np.concatenate(([0.], probcumsums / probcumsums[-1]))
+        for name, array in [('_binlims', binlims_array), ('_probs', 
+                probs_array), ('_probcumsums', probcumsums), ('_cdf', cdf)]:
+            array.flags.writeable = False
+            object.__setattr__(self, name, array)
+        # The inner bin limits and highest bin limit are also kept as Python 
+        # floats, for fast scalar lookups with bisect (see 
+        # calc_prob_from_prob_dist in the statistics module).
+        object.__setattr__(self, '_inner_binlims', tuple(binlims_array[1:-1].tolist()))
+        object.__setattr__(self, '_upper_binlim', binlims_array[-1].item())
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Prob_Dist instances are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Prob_Dist instances are immutable")
+
+    def __reduce__(self):
+        return (Prob_Dist, tuple(self))
+
+    def get_binlims(self):
+        return self._binlims
+
+    def get_probs(self):
+        return self._probs
+
+    def num_bins(self):
+        return len(self._probs)
+
+    def sample(self, n=None, rng=None):
+        """
+        Draws n random values from the distribution (or a single value, if n 
+        is None) by inverting the cumulative distribution function, using one 
+        uniform random number per value. rng is the random number generator to 
+        use (numpy.random by default).
+        """
+        if rng is None:
+            rng = np.random
+        if n == None:
+            return self.sample(1, rng)[0]
+        probcumsums = self._probcumsums
+        nums = rng.rand(n) * probcumsums[-1]
+        bins = np.searchsorted(probcumsums[:-1], nums, side='right')
+        probs = self._probs[bins]
+        fractions = (nums - (probcumsums[bins] - probs)) / probs
+        lowbinlims = self._binlims[bins]
+        return lowbinlims + fractions * (self._binlims[bins + 1] - lowbinlims)
+
+    def _find_bins(self, values):
+        """
+        Returns the bins the values fall into, with bins closed on the right 
+        and open on the left. Values below the lowest bin limit are given bin 
+        -1, and values above the highest bin limit are given bin num_bins().
+        """
+        return np.searchsorted(self._binlims, values, side='left') - 1
+
+    def prob_at(self, values, out_of_range='raise'):
+        """
+        Returns the probability assigned to the bins that each of the values 
+        fall into, with the same bin semantics as calc_prob_from_prob_dist in 
+        the statistics module (bins closed on the right, with the lowest bin 
+        limit included in the first bin).
+
+        out_of_range sets how values below the lowest or above the highest bin 
+        limit are handled: 'raise' raises a ValueError, and 'clip' assigns 
+        them to the first or last bin. NaN values always raise a ValueError.
+        """
+        values = np.asarray(values, dtype=float)
+        binlims = self._binlims
+        if out_of_range == 'raise':
+            # Written so that NaN values also count as out of range.
+            if not np.all((values >= binlims[0]) & (values <= binlims[-1])):
+                raise ValueError("values fall outside the bin limits of the probability distribution")
+        elif out_of_range == 'clip':
+            if np.any(np.isnan(values)):
+                raise ValueError("cannot calculate probabilities for NaN values")
+        else:
+            raise ValueError("out_of_range must be 'raise' or 'clip'")
+        # Searching only the inner bin limits places values below the range in 
+        # the first bin, and values above it in the last bin.
+        bins = np.searchsorted(binlims[1:-1], values, side='left')
+        return self._probs[bins]
+
+    def pdf(self, values):
+        """
+        Returns the probability density function of the (normalized) 
+        distribution at the given values.
+        """
+        bins = self._find_bins(np.asarray(values, dtype=float))
+        in_range = (bins >= 0) & (bins < len(self._probs))
+        bins = np.clip(bins, 0, len(self._probs) - 1)
+        widths = self._binlims[bins + 1] - self._binlims[bins]
+        densities = np.diff(self._cdf)[bins] / np.where(widths > 0, widths, 1)
+        return np.where(in_range & (widths > 0), densities, 0.)
+
+    def cdf(self, values):
+        """
+        Returns the cumulative distribution function of the (normalized) 
+        distribution at the given values.
+        """
+        return np.interp(values, self._binlims, self._cdf)
+
+# The number of months in each of the units of time probabilities can be 
+# specified in (see the probability_time_units rc parameter).
+_months_per_unit = {'months': 1, 'years': 12, 'decades': 120}
+
+class Probability_Table(dict):
+    """
+    An immutable table of probabilities indexed by integer times (for example 
+    ages, in probability_time_units). The probabilities are also stored in a 
+    contiguous numpy array covering the span of times given (with NaN for 
+    times within the span that do not have a probability), for vectorized 
+    unit conversion and lookups.
+
+    A Probability_Table is a read-only dictionary mapping each time to its 
+    probability (the format previously returned by the validate_probability 
+    rc parameter validation function), so single lookups such as::
+
+        probability[get_probability_index(age, prob_time_units)]
+
+    remain single dictionary lookups, though slower than for a plain 
+    dictionary (about 0.1 against 0.03 microseconds per lookup, with Python 
+    2.7). The probabilities for a whole array of times can be looked up at 
+    once with lookup.
+    """
+    def __init__(self, probabilities, start=0):
+        """
+        probabilities can be a dictionary mapping integer times to 
+        probabilities, or a sequence of probabilities for the times starting 
+        at 'start'.
+        """
+        if isinstance(probabilities, dict):
+            if len(probabilities) == 0:
+                values = np.zeros(0)
+            else:
+                start = min(probabilities.keys())
+                values = np.empty(max(probabilities.keys()) - start + 1)
+                values.fill(np.nan)
+                for t, probability in probabilities.iteritems():
+                    values[t - start] = probability
+        else:
+            values = np.array(probabilities, dtype=float)
+        values.flags.writeable = False
+        self._start = int(start)
+        self._values = values
+        dict.update(self, [(int(i) + self._start, value) for i, value in 
+            enumerate(values.tolist()) if value == value])
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Probability_Table instances are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = \
+            _read_only
+
+    def __reduce__(self):
+        return (Probability_Table, (self._values, self._start))
+
+    def get_start(self):
+        "Returns the first time covered by the table."
+        return self._start
+
+    def get_values(self):
+        """
+        Returns the (read-only) array of probabilities for each time from 
+        get_start() onwards, with NaN for times without a probability.
+        """
+        return self._values
+
+    def get_intervals(self):
+        """
+        Returns a list of (lower, upper, probability) tuples for the runs of 
+        times with the same probability, with each interval covering [lower, 
+        upper), as in the dictionaries accepted by validate_probability.
+        """
+        values = self._values
+        if len(values) == 0:
+            return []
+        # Find the positions where the probability changes (NaNs are compared 
+        # as equal to each other so a gap is a single run).
+        nans = np.isnan(values)
+        changes = (values[1:] != values[:-1]) & ~(nans[1:] & nans[:-1])
+        breaks = np.concatenate(([0], np.flatnonzero(changes) + 1, [len(values)]))
+        intervals = []
+        for lower, upper in zip(breaks[:-1], breaks[1:]):
+            if not nans[lower]:
+                intervals.append((int(lower) + self._start, int(upper) + 
+                    self._start, float(values[lower])))
+        return intervals
+
+    def __repr__(self):
+        return "{%s}"%", ".join(["(%s, %s): %r"%interval for interval in 
+            self.get_intervals()])
+
+    __str__ = __repr__
+
+    def convert_units(self, prob_time_units):
+        """
+        Returns a new Probability_Table with the probabilities converted from 
+        prob_time_units to monthly probabilities (see 
+        convert_probability_units in the statistics module). The times of the 
+        new table are still in prob_time_units.
+        """
+        try:
+            months = _months_per_unit[prob_time_units]
+        except KeyError:
+            raise ValueError("unhandled prob_time_units")
+        if months == 1:
+            return self
+        return Probability_Table(1 - (1 - self._values)**(1. / months), 
+                self._start)
+
+    def lookup(self, times, prob_time_units='months', default=None):
+        """
+        Returns an array of the probabilities for an array of times given in 
+        months (for example, the ages of a population of agents), converting 
+        the times to prob_time_units as get_probability_index in the 
+        statistics module does.
+
+        Times without a probability in the table raise a KeyError, unless a 
+        default is given, in which case they are given the default 
+        probability.
+        """
+        indices = self.get_indices(times, prob_time_units) - self._start
+        in_table = (indices >= 0) & (indices < len(self._values))
+        if np.all(in_table):
+            probabilities = self._values[indices]
+        else:
+            probabilities = np.empty(indices.shape)
+            probabilities.fill(np.nan)
+            probabilities[in_table] = self._values[indices[in_table]]
+        missing = np.isnan(probabilities)
+        if np.any(missing):
+            if default == None:
+                raise KeyError("no probability given for time %s"%
+                        np.asarray(times)[missing].flat[0])
+            probabilities[missing] = default
+        return probabilities
+
+    @staticmethod
+    def get_indices(times, prob_time_units):
+        """
+        Converts an array of times in months into an integer array of times in 
+        prob_time_units, rounding to the nearest unit (with halves rounded away 
+        from zero, as the built-in round function does).
+        """
+        try:
+            months = _months_per_unit[prob_time_units]
+        except KeyError:
+            raise ValueError("unhandled prob_time_units")
+        times = np.asarray(times)
+        if months == 1:
+            return times.astype(int)
+        times = times / months
+        return (np.sign(times) * np.floor(np.abs(times) + .5)).astype(int)
@@ -0,0 +1,185 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Contains functions for branching several scenario runs off a single 
+initialized model world, so that a shared burn-in period only needs to be run 
+once per batch of scenarios rather than once per scenario.
+
+On platforms with os.fork, each scenario runs in a child process forked from 
+the current process, so the children share the memory of the initialized 
+world copy-on-write. Elsewhere, the scenarios are run one after another, each 
+on an in-memory deep copy of the world.
+"""
+
+import os
+import sys
+import copy
+import select
+import signal
+import logging
+import traceback
+import cPickle
+
+from pyabm import np, rc_params
+from pyabm import random_streams
+
+logger = logging.getLogger(__name__)
+
+class ForkError(Exception):
+    pass
+
+def _apply_rc_overrides(rc_overrides):
+    """
+    Applies a dictionary of rc parameter overrides to the shared rcParams. If 
+    random_seed is overridden, numpy.random and the random_streams hierarchy 
+    are reseeded with the new seed.
+    """
+    rcParams = rc_params.get_params()
+    for key, value in rc_overrides.iteritems():
+        rcParams[key] = value
+    if 'random_seed' in rc_overrides:
+        np.random.seed(int(rcParams['random_seed']))
+        random_streams.seed_streams(int(rcParams['random_seed']))
+
+def _run_child(state, run_function, child_num, rc_overrides, write_fd):
+    "Runs a scenario in a forked child process, and never returns."
+    exit_code = 0
+    try:
+        try:
+            _apply_rc_overrides(rc_overrides)
+            result = (True, run_function(state, child_num))
+        except:
+            result = (False, traceback.format_exc())
+        data = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+        while data:
+            written = os.write(write_fd, data)
+            data = data[written:]
+        os.close(write_fd)
+    except:
+        exit_code = 1
+    os._exit(exit_code)
+
+def _fork_runs(state, run_function, rc_overrides_list, num_processes):
+    results = [None]*len(rc_overrides_list)
+    pending = list(enumerate(rc_overrides_list))
+    # running maps the read end of each child's pipe to a list of the child 
+    # number, the child process ID, and the data read so far.
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < num_processes:
+                child_num, rc_overrides = pending.pop(0)
+                read_fd, write_fd = os.pipe()
+                # Flush output buffers, so buffered output is not written 
+                # again by the child.
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read_fd)
+                    _run_child(state, run_function, child_num, rc_overrides, write_fd)
+                os.close(write_fd)
+                running[read_fd] = [child_num, pid, []]
+            ready_fds = select.select(running.keys(), [], [])[0]
+            for read_fd in ready_fds:
+                chunk = os.read(read_fd, 1 << 16)
+                if chunk:
+                    running[read_fd][2].append(chunk)
+                    continue
+                child_num, pid, chunks = running.pop(read_fd)
+                os.close(read_fd)
+                os.waitpid(pid, 0)
+                if not chunks:
+                    raise ForkError("scenario %s exited without returning a result"%child_num)
+                success, result = cPickle.loads(''.join(chunks))
+                if not success:
+                    raise ForkError("scenario %s failed:\n%s"%(child_num, result))
+                logger.debug("scenario %s finished"%child_num)
+                results[child_num] = result
+    finally:
+        # If a scenario failed (or the parent was interrupted), stop the 
+        # scenarios that are still running, so they are not left running 
+        # unreaped, with open pipes.
+        for read_fd, (child_num, pid, chunks) in running.iteritems():
+            os.close(read_fd)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                # The child has already exited.
+                pass
+            os.waitpid(pid, 0)
+    return results
+
+def _restore_rc_params(rcParams, params, original_values):
+    """
+    Restores the values of rcParams, and the unconverted original values that 
+    validate_items revalidates, saved before applying rc overrides.
+    """
+    dict.update(rcParams, params)
+    rcParams.original_value.clear()
+    rcParams.original_value.update(original_values)
+
+def _clone_runs(state, run_function, rc_overrides_list):
+    rcParams = rc_params.get_params()
+    params = dict(rcParams)
+    original_values = dict(rcParams.original_value)
+    rng_state = np.random.get_state()
+    stream_states = random_streams.get_stream_states()
+    results = []
+    try:
+        for child_num, rc_overrides in enumerate(rc_overrides_list):
+            np.random.set_state(rng_state)
+            random_streams.set_stream_states(stream_states)
+            _apply_rc_overrides(rc_overrides)
+            results.append(run_function(copy.deepcopy(state), child_num))
+            _restore_rc_params(rcParams, params, original_values)
+    finally:
+        _restore_rc_params(rcParams, params, original_values)
+        np.random.set_state(rng_state)
+        random_streams.set_stream_states(stream_states)
+    return results
+
+def fork_runs(state, run_function, rc_overrides_list, num_processes=None):
+    """
+    Runs one scenario for each dictionary of rc parameter overrides in 
+    rc_overrides_list, each starting from the current (already initialized, 
+    and typically burned-in) model state. state is any object holding the 
+    model state (the world, for example). For each scenario, the rc 
+    overrides are applied and then::
+
+        run_function(state, child_num)
+
+    is called, where child_num is the index of the scenario in 
+    rc_overrides_list. Returns a list of the (picklable) values returned by 
+    run_function, in the same order as rc_overrides_list.
+
+    Each scenario starts from the same numpy.random (and random_streams) 
+    state as the current process, unless its overrides include a random_seed. num_processes 
+    limits the number of scenarios run at once, and defaults to the 
+    batchrun.num_cores rc parameter.
+    """
+    rc_overrides_list = list(rc_overrides_list)
+    if num_processes == None:
+        num_processes = rc_params.get_params()['batchrun.num_cores']
+    num_processes = max(int(num_processes), 1)
+    if hasattr(os, 'fork'):
+        return _fork_runs(state, run_function, rc_overrides_list, num_processes)
+    else:
+        logger.info("os.fork not available - running scenarios on in-memory copies of the model state")
+        return _clone_runs(state, run_function, rc_overrides_list)
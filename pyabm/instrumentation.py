@@ -0,0 +1,180 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Contains lifecycle counters for instrumenting model runs. When enabled, the 
+Agent_set and Agent_Store classes count the agents added, removed, stored and 
+released in each timestep (by class), and record the number of agents held in 
+the Agent_Stores of each class (summed over the stores) at the end of each 
+timestep. Time spent in sections of model 
+code can also be recorded with Lifecycle_Counters.timer. The counts are kept in 
+numpy arrays preallocated for the whole run, and can be saved to a compact 
+file at the end of the run with Lifecycle_Counters.save.
+
+When the counters are not enabled, the only cost to the agent classes is a 
+check of the module-level 'counters' variable.
+"""
+
+import time
+import weakref
+from contextlib import contextmanager
+
+from pyabm import np
+
+# The operations counted for each class, in the order of the columns of the 
+# count arrays.
+OPERATIONS = ('add', 'remove', 'store', 'release', 'store_remove')
+
+# counters is the active Lifecycle_Counters instance, or None if lifecycle 
+# counting is disabled.
+counters = None
+
+class Lifecycle_Counters(object):
+    """
+    Per-timestep counts of agent lifecycle operations. The current timestep is 
+    read from the TimeSteps instance of the run whenever an operation is 
+    counted, so the counts do not need to be advanced manually.
+    """
+    def __init__(self, time_steps):
+        self._time_steps = time_steps
+        # Integer timesteps start at 1, and allow for the final increment of 
+        # the TimeSteps instance.
+        self._num_rows = time_steps.get_total_num_timesteps() + 2
+        # _counts stores an array of counts for each class, with one row per 
+        # timestep and one column per operation.
+        self._counts = {}
+        # _occupancy stores the number of agents held by the Agent_Store 
+        # instances of each class at the end of each timestep. 
+        # _store_occupancy stores the current number of agents in each store 
+        # (keyed by class name, then by store), and _occupancy_rows the last 
+        # row of each occupancy array that has been filled in.
+        self._occupancy = {}
+        self._store_occupancy = {}
+        self._occupancy_rows = {}
+        # _times stores the seconds spent in each timed section of code per 
+        # timestep.
+        self._times = {}
+        self._operation_columns = dict([(operation, n) for n, operation in \
+            enumerate(OPERATIONS)])
+
+    def _row(self):
+        return min(self._time_steps.get_cur_int_timestep(), self._num_rows - 1)
+
+    def _get_array(self, arrays, name, shape, dtype):
+        array = arrays.get(name)
+        if array is None:
+            array = arrays[name] = np.zeros(shape, dtype=dtype)
+        return array
+
+    def count(self, class_name, operation, num_agents=1):
+        counts = self._get_array(self._counts, class_name, (self._num_rows, 
+            len(OPERATIONS)), np.int64)
+        counts[self._row(), self._operation_columns[operation]] += num_agents
+
+    def record_occupancy(self, class_name, store, num_stored):
+        """
+        Records that 'store' (an instance of the class class_name) holds 
+        num_stored agents. The occupancy recorded for the current timestep is 
+        the total over all the stores of the class.
+        """
+        occupancy = self._get_array(self._occupancy, class_name, self._num_rows, 
+                np.int64)
+        store_occupancy = self._store_occupancy.get(class_name)
+        if store_occupancy is None:
+            store_occupancy = weakref.WeakKeyDictionary()
+            self._store_occupancy[class_name] = store_occupancy
+            self._occupancy_rows[class_name] = self._row()
+        store_occupancy[store] = num_stored
+        row = self._row()
+        self._carry_occupancy_forward(class_name, row)
+        occupancy[row] = sum(store_occupancy.values())
+
+    def _carry_occupancy_forward(self, class_name, row):
+        """
+        Fills the rows of an occupancy array after the last row filled in, up 
+        to and including 'row', with the last occupancy recorded. The 
+        occupancy of the stores only changes when they perform an operation, 
+        so timesteps without operations hold the same number of agents.
+        """
+        last_row = self._occupancy_rows[class_name]
+        if row > last_row:
+            occupancy = self._occupancy[class_name]
+            occupancy[last_row + 1:row + 1] = occupancy[last_row]
+            self._occupancy_rows[class_name] = row
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Context manager recording the time spent in a section of model code, 
+        for example::
+
+            with counters.timer('births'):
+                ...
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            times = self._get_array(self._times, name, self._num_rows, np.float64)
+            times[self._row()] += time.time() - start
+
+    def get_counts(self, class_name):
+        """
+        Returns the array of counts for a class, with one row per integer 
+        timestep and one column per operation (see OPERATIONS).
+        """
+        return self._counts[class_name]
+
+    def get_occupancy(self, class_name):
+        """
+        Returns the array of the number of agents held by the Agent_Stores of 
+        a class at the end of each timestep (up to the current timestep).
+        """
+        self._carry_occupancy_forward(class_name, self._row())
+        return self._occupancy[class_name]
+
+    def get_times(self, name):
+        return self._times[name]
+
+    def save(self, filename):
+        """
+        Saves the counts, store occupancy and timings to a compressed numpy 
+        .npz file, with arrays named 'counts/<class name>', 'occupancy/<class 
+        name>' and 'times/<section name>'.
+        """
+        arrays = {'operations': np.array(OPERATIONS)}
+        for class_name in self._occupancy:
+            self._carry_occupancy_forward(class_name, self._row())
+        for prefix, group in [('counts', self._counts), ('occupancy', 
+            self._occupancy), ('times', self._times)]:
+            for name, array in group.iteritems():
+                arrays['%s/%s'%(prefix, name)] = array
+        np.savez_compressed(filename, **arrays)
+
+def enable_lifecycle_counters(time_steps):
+    """
+    Enables lifecycle counting for a model run, and returns the 
+    Lifecycle_Counters instance.
+    """
+    global counters
+    counters = Lifecycle_Counters(time_steps)
+    return counters
+
+def disable_lifecycle_counters():
+    global counters
+    counters = None
@@ -37,6 +37,9 @@ from pkg_resources import resource_string
 
 import numpy as np
 
+from distributions import Prob_Dist, Probability_Table
+from random_streams import seed_streams
+
 logger = logging.getLogger(__name__)
 
 class KeyError(Exception):
@@ -100,6 +103,39 @@ def validate_unit_interval(s):
         raise ValueError('"%s" is not on the closed unit interval [0,1]'%s)
     return s
 
+def validate_covariance_matrix(s):
+    """
+    Validates a covariance matrix (of regression coefficient estimates, for 
+    example) specified as a tuple of rows::
+
+        ((var_a, cov_ab), (cov_ab, var_b))
+
+    Checks that the matrix is square, symmetric and positive semi-definite, 
+    and returns it as a tuple of tuples of floats.
+    """
+    error_msg = """Invalid covariance matrix: %s
+
+    Covariance matrices must be specified as a tuple of rows, where each row 
+    is a tuple of floats, for example:
+
+        ((var_a, cov_ab), (cov_ab, var_b))"""
+    try:
+        if type(s) == str:
+            rows = eval(s)
+        else:
+            rows = s
+        matrix = np.array(rows, dtype=float)
+    except (TypeError, ValueError, SyntaxError, NameError):
+        raise SyntaxError(error_msg%(s,))
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(error_msg%(s,))
+    if not np.allclose(matrix, matrix.T):
+        raise ValueError("covariance matrix is not symmetric - error reading %s"%(s,))
+    eigenvalues = np.linalg.eigvalsh(matrix)
+    if len(eigenvalues) > 0 and eigenvalues.min() < -1e-10*max(abs(eigenvalues).max(), 1):
+        raise ValueError("covariance matrix is not positive semi-definite - error reading %s"%(s,))
+    return tuple([tuple(row) for row in matrix.tolist()])
+
 def validate_readable_file(s):
     """Checks that a file exists and is readable."""
     if (type(s) != str):
@@ -279,12 +315,13 @@ class validate_probability:
     but excluding the maximum value 'max'.
     
     This function validates the probabilities lie on the unit interval, and 
-    then returns a dictionary object where there is a key for each age value in 
-    the interval specified. Therefore,::
+    then returns a Probability_Table (a read-only dictionary backed by a numpy 
+    array) where there is a key for each age value in the interval specified.  
+    Therefore,::
 
         {(0,2):.6, (2,5):.9}
 
-    would be converted to::
+    would be converted to a table equivalent to::
 
         {0:.6, 1:.6, 2:.9, 3:.9, 4:.9}
     """
@@ -316,7 +353,7 @@ class validate_probability:
         if type(input) != dict:
             raise SyntaxError(error_msg%(s))
 
-        probability_dict = {}
+        intervals = []
         key_converter_tuple = validate_nseq_int(2) 
         for item in input.iteritems():
             # First convert the probability interval tuple (item[0]) from a string 
@@ -332,23 +369,39 @@ class validate_probability:
             elif lower_lim == upper_lim:
                 raise ValueError("lower_lim = upper_lim for probability dictionary key '(%s, %s)'."%(key))
             probability = validate_unit_interval(item[1])
-            for t in xrange(lower_lim, upper_lim):
-                if t in probability_dict:
-                    raise ValueError("probability is specified twice for dictionary key '%s'."%(t))
-                probability_dict[t] = probability
-        for key in probability_dict.keys():
-            if key < self.min or key >= self.max:
+            if lower_lim < self.min or upper_lim > self.max:
+                if lower_lim < self.min:
+                    key = lower_lim
+                else:
+                    key = max(lower_lim, self.max)
                 raise ValueError("A probability is given for a time outside the \
 specified overall probability interval.\nA probability is given for time %s, but the overall \
 probability interval is [%s, %s)."%(key, self.min, self.max))
-        return probability_dict
+            intervals.append((lower_lim, upper_lim, probability))
+        if len(intervals) == 0:
+            return Probability_Table({})
+        # Fill the intervals into a single array spanning all of the 
+        # intervals, rather than storing a key for each value of t.
+        start = min([interval[0] for interval in intervals])
+        end = max([interval[1] for interval in intervals])
+        values = np.empty(end - start)
+        values.fill(np.nan)
+        for lower_lim, upper_lim, probability in sorted(intervals):
+            if not np.all(np.isnan(values[lower_lim - start:upper_lim - start])):
+                t = lower_lim + np.flatnonzero(~np.isnan(values[lower_lim - 
+                    start:upper_lim - start]))[0]
+                raise ValueError("probability is specified twice for dictionary key '%s'."%(t))
+            values[lower_lim - start:upper_lim - start] = probability
+        return Probability_Table(values, start)
 
 def validate_prob_dist(s):
-    # TODO: Finish documenting this section.
     """
-    Validates a probability distribution specified as a dictionary where each 
-    key is a tuple specifying the interval to which the probability applies (in 
-    probability_time_units). 
+    Validates a probability distribution specified as a length two tuple of 
+    bin limits and bin probabilities (see the error message below), and 
+    returns it as a Prob_Dist instance. A Prob_Dist can still be used as a 
+    (binlims, probs) tuple, but stores its cumulative probabilities as numpy 
+    arrays so they do not need to be recalculated each time the distribution 
+    is used.
     """
     error_msg = """
     Invalid probability distribution parameter tuple: %s
@@ -382,9 +435,12 @@ def validate_prob_dist(s):
                 # which there is only one value in this case) is stored as a 
                 # length 1 tuple as this is the format expected by the 
                 # statistics functions.
-                raise SyntaxError("Length of probability tuple must be 1 less than the length of the bin limit tuple - error reading %s"%key)
+                raise SyntaxError("Length of probability tuple must be 1 less than the length of the bin limit tuple - error reading %s"%(s,))
 
-    return prob_dist_tuple
+    try:
+        return Prob_Dist(prob_dist_tuple[0], prob_dist_tuple[1])
+    except ValueError, msg:
+        raise ValueError("%s - error reading %s"%(msg, s))
 
 def validate_time_bounds(values):
     """Converts and validates the start and stop time for the model. Checks to 
@@ -690,6 +746,7 @@ class rc_params_management():
             # later reuse (for testing, etc.).
             self._rcParams['random_seed'] = int(10**8 * np.random.random())
         np.random.seed(int(self._rcParams['random_seed']))
+        seed_streams(int(self._rcParams['random_seed']))
         logger.debug("Random seed set to %s"%int(self._rcParams['random_seed']))
 
     def write_RC_file(self, outputFilename, docstring=None):
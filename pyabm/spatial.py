@@ -0,0 +1,229 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Contains a spatial index for agents with coordinates (any agent with a
+get_coords method returning an (x, y) tuple, such as neighborhoods), for
+finding the agents within a given distance of a point, or the nearest agents
+to a point, without comparing every pair of agents.
+"""
+
+from __future__ import division
+
+import math
+
+from pyabm import np
+
+class Grid_Index(object):
+    """
+    A uniform grid spatial index. Agent coordinates are stored in numpy
+    arrays, and the agents are hashed into square grid cells of side
+    cell_size, so that queries only need to calculate distances to the agents
+    in the cells near the query point.
+
+    If cell_size is not given, it is chosen from the extent of the initial
+    agents so that there are about four agents per cell.
+    """
+    def __init__(self, agents=(), cell_size=None):
+        agents = list(agents)
+        if cell_size == None:
+            cell_size = self._default_cell_size(agents)
+        if cell_size <= 0:
+            raise ValueError("cell_size must be > 0")
+        self._cell_size = float(cell_size)
+        capacity = max(len(agents), 16)
+        self._x = np.zeros(capacity)
+        self._y = np.zeros(capacity)
+        # _agents stores the agent in each row of the coordinate arrays, and
+        # _rows maps agents back to their rows.
+        self._agents = []
+        self._rows = {}
+        # _cells maps (column, row) grid cell tuples to sets of rows in the
+        # coordinate arrays, and _row_cells stores the cell of each row.
+        self._cells = {}
+        self._row_cells = []
+        for agent in agents:
+            self.add(agent)
+
+    @staticmethod
+    def _default_cell_size(agents):
+        if len(agents) < 2:
+            return 1.
+        coords = np.array([agent.get_coords() for agent in agents], dtype=float)
+        width, height = coords.max(axis=0) - coords.min(axis=0)
+        area = max(width, 1e-12)*max(height, 1e-12)
+        return max(math.sqrt(4*area / len(agents)), 1e-12)
+
+    def _cell(self, x, y):
+        return (int(math.floor(x / self._cell_size)),
+                int(math.floor(y / self._cell_size)))
+
+    def add(self, agent):
+        "Adds an agent to the index, at the location given by get_coords."
+        if agent in self._rows:
+            raise KeyError("agent %s is already in the spatial index"%agent.get_ID())
+        x, y = agent.get_coords()
+        row = len(self._agents)
+        if row == len(self._x):
+            self._x = np.concatenate((self._x, np.zeros(row)))
+            self._y = np.concatenate((self._y, np.zeros(row)))
+        self._x[row] = x
+        self._y[row] = y
+        cell = self._cell(x, y)
+        self._cells.setdefault(cell, set()).add(row)
+        self._row_cells.append(cell)
+        self._agents.append(agent)
+        self._rows[agent] = row
+
+    def remove(self, agent):
+        "Removes an agent from the index."
+        try:
+            row = self._rows.pop(agent)
+        except KeyError:
+            raise KeyError("agent %s is not in the spatial index"%agent.get_ID())
+        self._remove_from_cell(row, self._row_cells[row])
+        last = len(self._agents) - 1
+        if row != last:
+            # Move the last row into the hole left by the removed agent.
+            moved_agent = self._agents[last]
+            moved_cell = self._row_cells[last]
+            self._x[row] = self._x[last]
+            self._y[row] = self._y[last]
+            self._agents[row] = moved_agent
+            self._row_cells[row] = moved_cell
+            self._rows[moved_agent] = row
+            cell_rows = self._cells[moved_cell]
+            cell_rows.remove(last)
+            cell_rows.add(row)
+        self._agents.pop()
+        self._row_cells.pop()
+
+    def _remove_from_cell(self, row, cell):
+        cell_rows = self._cells[cell]
+        cell_rows.remove(row)
+        if not cell_rows:
+            del self._cells[cell]
+
+    def update(self, agent):
+        """
+        Updates the location of an agent that has moved, using the agent's
+        get_coords method.
+        """
+        row = self._rows[agent]
+        x, y = agent.get_coords()
+        self._x[row] = x
+        self._y[row] = y
+        cell = self._cell(x, y)
+        if cell != self._row_cells[row]:
+            self._remove_from_cell(row, self._row_cells[row])
+            self._cells.setdefault(cell, set()).add(row)
+            self._row_cells[row] = cell
+
+    def _rows_in_cells(self, min_cell, max_cell):
+        "Returns an array of the rows in a rectangular block of cells."
+        (min_i, min_j), (max_i, max_j) = min_cell, max_cell
+        rows = []
+        if (max_i - min_i + 1)*(max_j - min_j + 1) > len(self._cells):
+            # The block covers more cells than are occupied, so check each
+            # occupied cell instead.
+            for (i, j), cell_rows in self._cells.iteritems():
+                if min_i <= i <= max_i and min_j <= j <= max_j:
+                    rows.extend(cell_rows)
+        else:
+            cells = self._cells
+            for i in xrange(min_i, max_i + 1):
+                for j in xrange(min_j, max_j + 1):
+                    cell_rows = cells.get((i, j))
+                    if cell_rows:
+                        rows.extend(cell_rows)
+        return np.array(rows, dtype=np.intp)
+
+    def _sorted_agents(self, rows, distances):
+        "Returns the agents in rows ordered by distance (then by row)."
+        order = np.lexsort((rows, distances))
+        return [self._agents[row] for row in rows[order]], distances[order]
+
+    def _distances(self, x, y, rows):
+        return np.hypot(self._x[rows] - x, self._y[rows] - y)
+
+    def radius_query(self, points, radius):
+        """
+        Returns, for each (x, y) point in points, a list of the agents within
+        'radius' of that point, ordered by distance.
+        """
+        results = []
+        for x, y in points:
+            rows = self._rows_in_cells(self._cell(x - radius, y - radius),
+                    self._cell(x + radius, y + radius))
+            distances = self._distances(x, y, rows)
+            within = distances <= radius
+            agents, distances = self._sorted_agents(rows[within], distances[within])
+            results.append(agents)
+        return results
+
+    def knn_query(self, points, k):
+        """
+        Returns, for each (x, y) point in points, a list of the k agents
+        nearest to that point, ordered by distance. If there are fewer than k
+        agents in the index, all the agents are returned.
+        """
+        k = min(k, len(self._agents))
+        if k <= 0:
+            return [[] for point in points]
+        cells = np.array(self._cells.keys())
+        min_i, min_j = cells.min(axis=0)
+        max_i, max_j = cells.max(axis=0)
+        results = []
+        for x, y in points:
+            i, j = self._cell(x, y)
+            # The number of rings of cells around the point's cell needed to
+            # cover every occupied cell.
+            max_ring = max(i - min_i, max_i - i, j - min_j, max_j - j, 0)
+            # Start with the first ring reaching an occupied cell.
+            ring = max(min_i - i, i - max_i, min_j - j, j - max_j, 0)
+            while True:
+                rows = self._rows_in_cells((i - ring, j - ring), (i + ring, j + ring))
+                if len(rows) >= k:
+                    distances = self._distances(x, y, rows)
+                    # Every agent outside the searched block of cells is at
+                    # least ring*cell_size away, so the search can stop once
+                    # the kth nearest candidate is closer than that.
+                    kth_distance = np.sort(distances)[k - 1]
+                    if kth_distance <= ring*self._cell_size or ring >= max_ring:
+                        break
+                ring += 1
+            agents, distances = self._sorted_agents(rows, distances)
+            results.append(agents[:k])
+        return results
+
+    def within(self, point, radius):
+        "Returns a list of the agents within 'radius' of a single point."
+        return self.radius_query([point], radius)[0]
+
+    def nearest(self, point, k=1):
+        "Returns a list of the k agents nearest to a single point."
+        return self.knn_query([point], k)[0]
+
+    def get_cell_size(self):
+        return self._cell_size
+
+    def __len__(self):
+        return len(self._agents)
+
+    def __contains__(self, agent):
+        return agent in self._rows
@@ -20,7 +20,10 @@
 Contains miscellaneous functions useful in running statistics for agent-based models.
 """
 
-from pyabm import np
+from bisect import bisect_left
+
+from pyabm import np, boolean_choices
+from pyabm.distributions import Prob_Dist, Probability_Table
 
 class UnitsError(Exception):
     pass
@@ -34,7 +37,17 @@ def convert_probability_units(probability, prob_time_units):
     function is uniform across the interval.
 
     Conversions are made accordingly using conditional probability.
+
+    If probability is a Probability_Table (as returned by the 
+    validate_probability rc parameter validation function), the conversion is 
+    vectorized, and a new Probability_Table is returned (as Probability_Table 
+    instances cannot be modified in place).
     """
+    if isinstance(probability, Probability_Table):
+        try:
+            return probability.convert_units(prob_time_units)
+        except ValueError:
+            raise UnitsError("unhandled prob_time_units")
     # If the probability time units don't match the model timestep units, then the 
     # probabilities need to be converted.
     if prob_time_units == 'months':
@@ -56,7 +69,18 @@ def get_probability_index(t, prob_time_units):
     months, ``get_probability_index``, when provided with an age in months, will convert 
     it to decades, rounding down. NOTE: all probabilities must be expressed with the 
     same time units.
+
+    If t is a numpy array, an integer array of indices is returned, rounded the 
+    same way as for a single t. The array of indices can be used to index the 
+    array returned by Probability_Table.get_values (after subtracting 
+    Probability_Table.get_start), or Probability_Table.lookup can be used to 
+    look up the probabilities for an array of times directly.
     """
+    if isinstance(t, np.ndarray):
+        try:
+            return Probability_Table.get_indices(t, prob_time_units)
+        except ValueError:
+            raise UnitsError("unhandled prob_time_units")
     if prob_time_units == 'months':
         return t
     elif prob_time_units == 'years':
@@ -66,7 +90,7 @@ def get_probability_index(t, prob_time_units):
     else:
         raise UnitsError("unhandled prob_time_units")
 
-def draw_from_prob_dist(prob_dist):
+def draw_from_prob_dist(prob_dist, size=None, rng=None):
     """
     Draws a random number from a manually specified probability distribution,
     where the probability distribution is a tuple specified as::
@@ -76,11 +100,37 @@ def draw_from_prob_dist(prob_dist):
     where a, b, c, and d are bin limits, and 1, 2, and 3 are the probabilities 
     assigned to each bin. Notice one more bin limit must be specified than the 
     number of probabilities given (to close the interval).
+
+    If size is given, an array of size random numbers is drawn in a single 
+    vectorized call, with one uniform random number used per value drawn.  
+    Values drawn this way follow the same distribution as single draws (a bin 
+    is chosen according to the bin probabilities, and the value is uniformly 
+    distributed within that bin).
+
+    prob_dist can also be a Prob_Dist instance (as returned by the 
+    validate_prob_dist rc parameter validation function), in which case the 
+    precomputed cumulative probabilities of the Prob_Dist are used.
+
+    rng is the random number generator to draw from (a RandomState, such as a 
+    stream from the random_streams module), and defaults to numpy.random.
     """
+    if rng == None:
+        rng = np.random
+    if isinstance(prob_dist, Prob_Dist):
+        if size != None:
+            return prob_dist.sample(size, rng)
+        # Draw the bin and the value within the bin as in the tuple case 
+        # below, so the same random numbers are drawn.
+        probcumsums = prob_dist._probcumsums
+        num = rng.rand() * probcumsums[-1]
+        n = np.searchsorted(probcumsums[:-1], num, side='right')
+        return rng.uniform(prob_dist._binlims[n], prob_dist._binlims[n+1])
+    binlims, probs = prob_dist
+    if size != None:
+        return _draw_array_from_prob_dist(binlims, probs, size, rng)
     # First randomly choose the bin, with the bins chosen according to their 
     # probability.
-    binlims, probs = prob_dist
-    num = np.random.rand() * np.sum(probs)
+    num = rng.rand() * np.sum(probs)
     n = 0
     probcumsums = np.cumsum(probs)
     for problim in probcumsums[0:-1]:
@@ -91,7 +141,25 @@ def draw_from_prob_dist(prob_dist):
     lowbinlim = binlims[n]
     # Now we know the bin lims, so draw a random number evenly distributed 
     # between those two limits.
-    return np.random.uniform(lowbinlim, upbinlim)
+    return rng.uniform(lowbinlim, upbinlim)
+
+def _draw_array_from_prob_dist(binlims, probs, size, rng):
+    """
+    Draws an array of random numbers from a probability distribution by 
+    inverting its (piecewise linear) cumulative distribution function.
+    """
+    binlims = np.asarray(binlims, dtype=float)
+    probs = np.atleast_1d(np.asarray(probs, dtype=float))
+    probcumsums = np.cumsum(probs)
+    nums = rng.rand(size) * probcumsums[-1]
+    # Choose the bins as in the scalar case: each number falls in the first 
+    # bin whose cumulative probability is greater than it.
+    bins = np.searchsorted(probcumsums[:-1], nums, side='right')
+    # The position of each number within the cumulative probability of its 
+    # bin gives its position within the bin limits.
+    fractions = (nums - (probcumsums[bins] - probs[bins])) / probs[bins]
+    lowbinlims = binlims[bins]
+    return lowbinlims + fractions * (binlims[bins + 1] - lowbinlims)
 
 def calc_prob_from_prob_dist(prob_dist, attribute):
     """
@@ -112,7 +180,15 @@ def calc_prob_from_prob_dist(prob_dist, attribute):
     agent, 'attribute' should be the age difference. This function will then 
     return the probability of marrying that spouse based on the bin that the 
     spouse age difference falls into.
+
+    prob_dist can also be a Prob_Dist instance.
     """
+    if isinstance(prob_dist, Prob_Dist):
+        # Written so that NaN attributes also raise an IndexError, as they do 
+        # for the tuple form below.
+        if not attribute <= prob_dist._upper_binlim:
+            raise IndexError("attribute %s is above the highest bin limit"%attribute)
+        return prob_dist[1][bisect_left(prob_dist._inner_binlims, attribute)]
     binlims, probs = prob_dist
     n = 0
     for uplim in binlims[1:]:
@@ -123,7 +199,27 @@ def calc_prob_from_prob_dist(prob_dist, attribute):
     # between those two limits.
     return probs[n]
 
-def calc_coefficient(coef_tuple):
+def calc_probs_from_prob_dist(prob_dist, attributes, out_of_range='raise'):
+    """
+    Vectorized version of ``calc_prob_from_prob_dist``, that returns an array 
+    of the probabilities for each value in the array 'attributes', using the 
+    same (right-closed) bins.
+
+    out_of_range sets how attributes outside the bin limits of the 
+    distribution are handled: 'raise' (the default) raises a ValueError, and 
+    'clip' gives attributes below the lowest bin limit the probability of the 
+    first bin, and attributes above the highest bin limit the probability of 
+    the last bin.
+
+    prob_dist can be a (binlims, probs) tuple or a Prob_Dist instance. Passing 
+    a Prob_Dist avoids converting the tuple to arrays on every call.
+    """
+    if not isinstance(prob_dist, Prob_Dist):
+        binlims, probs = prob_dist
+        prob_dist = Prob_Dist(binlims, probs)
+    return prob_dist.prob_at(attributes, out_of_range)
+
+def calc_coefficient(coef_tuple, rng=None):
     """
     Use to handle uncertainty in regression coefficients. ``calc_coefficient`` 
     takes in a tuple of two floats::
@@ -132,7 +228,417 @@ def calc_coefficient(coef_tuple):
 
     where coef is the estimated regression coefficient, and stderror is the 
     standard error of the estimated coefficient.
+
+    rng is the random number generator to draw from, and defaults to 
+    numpy.random.
     """
+    if rng == None:
+        rng = np.random
     if len(coef_tuple) != 2:
         raise ValueError("coef_tuple must be of the from (coef, stderror)")
-    return coef_tuple[0] + np.random.randn() * coef_tuple[1]
+    return coef_tuple[0] + rng.randn() * coef_tuple[1]
+
+class Coefficient_Set(object):
+    """
+    A set of named regression coefficients with uncertainty, given by their 
+    estimated means and either their standard errors or the full covariance 
+    matrix of the estimates. Rather than drawing each coefficient 
+    independently (as calc_coefficient does), the whole coefficient vector is 
+    drawn at once from a multivariate normal distribution, so correlations 
+    between the estimates are preserved.
+
+    The most recent draw is cached, so a set of coefficients can be drawn 
+    once per model run, or once per timestep (see get_draw), and then shared 
+    by every agent.
+    """
+    def __init__(self, names, means, covariance=None, stderrors=None):
+        """
+        names is a list of the coefficient names, and means the estimated 
+        coefficients. Either covariance (a square matrix) or stderrors (the 
+        standard errors of each coefficient, assumed to be uncorrelated) can 
+        be given. If neither is given the coefficients are fixed at their 
+        means.
+        """
+        self._names = list(names)
+        self._positions = dict([(name, n) for n, name in 
+            enumerate(self._names)])
+        if len(self._positions) != len(self._names):
+            raise ValueError("coefficient names must be unique")
+        self._means = np.array(means, dtype=float)
+        num_coefs = len(self._names)
+        if self._means.shape != (num_coefs,):
+            raise ValueError("one mean must be given for each coefficient")
+        if covariance is not None and stderrors is not None:
+            raise ValueError("covariance and stderrors cannot both be given")
+        if covariance is not None:
+            covariance = np.array(covariance, dtype=float)
+        elif stderrors is not None:
+            covariance = np.diag(np.array(stderrors, dtype=float)**2)
+        else:
+            covariance = np.zeros((num_coefs, num_coefs))
+        if covariance.shape != (num_coefs, num_coefs):
+            raise ValueError("covariance must be a %s by %s matrix"%(num_coefs, 
+                num_coefs))
+        self._covariance = covariance
+        self._factor = self._factor_covariance(covariance)
+        self._draw = None
+        self._draw_key = None
+
+    @staticmethod
+    def _factor_covariance(covariance):
+        """
+        Returns a matrix A with A A' = covariance, so that means + A z (where z 
+        is a vector of standard normal variates) is multivariate normal with 
+        the given covariance.
+        """
+        try:
+            return np.linalg.cholesky(covariance)
+        except np.linalg.LinAlgError:
+            # The Cholesky decomposition fails for singular matrices (such as 
+            # when some coefficients are fixed), so fall back on the 
+            # eigendecomposition.
+            eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+            if eigenvalues.min() < -1e-10*max(abs(eigenvalues).max(), 1):
+                raise ValueError("covariance matrix is not positive semi-definite")
+            return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    @classmethod
+    def from_rc_params(cls, rcParams, keys, covariance_key=None):
+        """
+        Builds a Coefficient_Set from rc parameters, where keys is a list of 
+        the rc parameter keys of the coefficients. Each coefficient is 
+        specified as a (coef, stderror) tuple, as for calc_coefficient. If 
+        covariance_key is given, the covariance matrix of the coefficients is 
+        read from that rc parameter (see validate_covariance_matrix in 
+        rcsetup), and the standard errors in the coefficient tuples are not 
+        used.
+        """
+        coef_tuples = [rcParams[key] for key in keys]
+        for key, coef_tuple in zip(keys, coef_tuples):
+            if len(coef_tuple) != 2:
+                raise ValueError("rc parameter %s must be of the form (coef, stderror)"%key)
+        means = [coef_tuple[0] for coef_tuple in coef_tuples]
+        if covariance_key == None:
+            return cls(keys, means, stderrors=[coef_tuple[1] for coef_tuple in 
+                coef_tuples])
+        else:
+            return cls(keys, means, covariance=rcParams[covariance_key])
+
+    def get_names(self):
+        return list(self._names)
+
+    def get_means(self):
+        return self._means
+
+    def get_covariance(self):
+        return self._covariance
+
+    def num_coefficients(self):
+        return len(self._names)
+
+    def draw(self, rng=None):
+        """
+        Draws a new coefficient vector (with a single multivariate normal draw, 
+        using one standard normal variate per coefficient), caches it as the 
+        current draw, and returns it. rng is the random number generator to 
+        use, and defaults to numpy.random.
+        """
+        if rng == None:
+            rng = np.random
+        draw = self._means + np.dot(self._factor, 
+                rng.standard_normal(len(self._names)))
+        draw.flags.writeable = False
+        self._draw = draw
+        self._draw_key = None
+        return draw
+
+    def get_draw(self, key=None, rng=None):
+        """
+        Returns the current coefficient vector. If key is given (for example 
+        the current timestep), a new vector is drawn whenever key differs 
+        from the key of the current draw, so that the coefficients are drawn 
+        once per timestep. Without a key, the coefficients are drawn on the 
+        first call only (once per run), until draw is called again.
+        """
+        if self._draw is None or (key != None and key != self._draw_key):
+            self.draw(rng)
+            self._draw_key = key
+        return self._draw
+
+    def get_coefficient(self, name, key=None, rng=None):
+        "Returns the current draw of a single coefficient (see get_draw)."
+        return self.get_draw(key, rng)[self._positions[name]]
+
+    def get_position(self, name):
+        "Returns the position of a coefficient in the coefficient vector."
+        return self._positions[name]
+
+    def __getitem__(self, name):
+        return self.get_coefficient(name)
+
+    def __len__(self):
+        return len(self._names)
+
+def _build_alias_table(weights):
+    """
+    Builds an alias table for the given (non-negative) weights using Vose's 
+    method. Returns arrays (probs, aliases): outcome i is chosen by picking a 
+    column i uniformly at random, and then keeping i with probability 
+    probs[i], or otherwise choosing aliases[i].
+    """
+    num_weights = len(weights)
+    total = float(np.sum(weights))
+    probs = np.ones(num_weights)
+    aliases = np.arange(num_weights)
+    if total <= 0:
+        # The table is never used if the weights are all zero (as for an empty 
+        # block of an Alias_Sampler).
+        return probs, aliases
+    scaled = (np.asarray(weights, dtype=float) * (num_weights / total)).tolist()
+    small = [i for i in xrange(num_weights) if scaled[i] < 1]
+    large = [i for i in xrange(num_weights) if scaled[i] >= 1]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        probs[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] = (scaled[more] + scaled[less]) - 1
+        if scaled[more] < 1:
+            small.append(more)
+        else:
+            large.append(more)
+    # Any remaining columns are (up to rounding error) full.
+    return probs, aliases
+
+class Alias_Sampler(object):
+    """
+    Draws random outcomes (indices 0 to n-1) from a discrete distribution 
+    given by a list of n weights, in constant time per draw, using alias 
+    tables (Walker's alias method, with tables built by Vose's method). 
+
+    The outcomes are split into blocks of block_size outcomes (by default, 
+    about the square root of the number of outcomes). Each block has its own 
+    alias table, and a top level alias table chooses between the blocks 
+    according to their total weights. Each draw uses two uniform random 
+    numbers: one to choose a block and one to choose an outcome within it.
+    When a few weights change (see update), only the tables of the blocks 
+    containing them and the (small) top level table are rebuilt.
+    """
+    def __init__(self, weights, block_size=None):
+        weights = np.array(weights, dtype=float)
+        if weights.ndim != 1 or len(weights) == 0:
+            raise ValueError("weights must be a non-empty list of numbers")
+        num_weights = len(weights)
+        if block_size == None:
+            block_size = int(np.ceil(np.sqrt(num_weights)))
+        self._block_size = block_size
+        self._num_blocks = int(np.ceil(num_weights / float(block_size)))
+        self._num_weights = num_weights
+        # The weights are padded with zeros to fill the last block.
+        self._weights = np.zeros(self._num_blocks * block_size)
+        self._probs = np.ones(len(self._weights))
+        self._aliases = np.arange(len(self._weights))
+        self._block_totals = np.zeros(self._num_blocks)
+        self._set_weights(np.arange(num_weights), weights)
+        self._rebuild_blocks(np.arange(self._num_blocks))
+
+    def _set_weights(self, indices, weights):
+        if np.any(~np.isfinite(weights)) or np.any(weights < 0):
+            raise ValueError("weights must be finite and >= 0")
+        self._weights[indices] = weights
+
+    def _rebuild_blocks(self, blocks):
+        block_size = self._block_size
+        for block in blocks:
+            start = block * block_size
+            end = start + block_size
+            probs, aliases = _build_alias_table(self._weights[start:end])
+            self._probs[start:end] = probs
+            self._aliases[start:end] = aliases + start
+            self._block_totals[block] = np.sum(self._weights[start:end])
+        if np.sum(self._block_totals) <= 0:
+            raise ValueError("weights must sum to a value > 0")
+        self._block_probs, self._block_aliases = \
+                _build_alias_table(self._block_totals)
+
+    def update(self, indices, weights):
+        """
+        Changes the weights of the outcomes in indices to weights, rebuilding 
+        only the alias tables of the blocks containing those outcomes.
+        """
+        indices = np.atleast_1d(np.asarray(indices, dtype=int))
+        weights = np.ones(indices.shape) * np.asarray(weights, dtype=float)
+        if np.any((indices < 0) | (indices >= self._num_weights)):
+            raise IndexError("outcome index out of range")
+        self._set_weights(indices, weights)
+        self._rebuild_blocks(np.unique(indices // self._block_size))
+
+    def sample(self, n=None, rng=None):
+        """
+        Draws n outcomes (or a single outcome, if n is None), returned as an 
+        array of indices into the weights. rng is the random number generator 
+        to use, and defaults to numpy.random.
+        """
+        if rng == None:
+            rng = np.random
+        if n == None:
+            return int(self.sample(1, rng)[0])
+        # Choose the blocks.
+        # (The minimum guards against rand() * k rounding up to k.)
+        nums = rng.rand(n) * self._num_blocks
+        blocks = np.minimum(nums.astype(int), self._num_blocks - 1)
+        keep = (nums - blocks) < self._block_probs[blocks]
+        blocks = np.where(keep, blocks, self._block_aliases[blocks])
+        # Choose the outcomes within the blocks.
+        nums = rng.rand(n) * self._block_size
+        columns = np.minimum(nums.astype(int), self._block_size - 1)
+        outcomes = blocks * self._block_size + columns
+        keep = (nums - columns) < self._probs[outcomes]
+        return np.where(keep, outcomes, self._aliases[outcomes])
+
+    def get_weights(self):
+        return self._weights[:self._num_weights].copy()
+
+    def get_probs(self):
+        "Returns the probability of each outcome."
+        weights = self._weights[:self._num_weights]
+        return weights / np.sum(weights)
+
+    def __len__(self):
+        return self._num_weights
+
+def _get_column(columns, name):
+    """
+    Returns the 'name' column of columns, which can be a dictionary of arrays, 
+    or an object with a get_column method (such as a Column_Store, or an 
+    Agent_set with a column store).
+    """
+    if hasattr(columns, 'get_column'):
+        return np.asarray(columns.get_column(name), dtype=float)
+    else:
+        return np.asarray(columns[name], dtype=float)
+
+class Linear_Predictor(object):
+    """
+    A linear predictor (as in a logistic or discrete-time hazard regression), 
+    declared once and then evaluated for a whole population of agents at a 
+    time. The predictor is a list of (coefficient name, term) pairs, where 
+    each term is one of:
+
+        None
+            an intercept
+        'column'
+            the values of an agent attribute column
+        ('column_a', 'column_b', ...)
+            an interaction term (the product of the columns)
+
+    The coefficients are taken from a Coefficient_Set, and the columns from 
+    a dictionary of arrays (one value per agent), a Column_Store, or an 
+    Agent_set with a column store. The terms are assembled into a design 
+    matrix, and the linear predictor for every agent is calculated with a 
+    single matrix-vector product. The link is the link function of the 
+    regression: 'logit' (logistic regression), 'cloglog' (complementary 
+    log-log, for discrete-time hazard models), or 'identity'.
+
+    For example::
+
+        predictor = Linear_Predictor(coefficients, [('intercept', None), 
+            ('age', 'age'), ('age_x_female', ('age', 'is_female'))])
+        death_probs = predictor.probabilities(person_columns, timestep)
+
+    The coefficients are drawn from the Coefficient_Set with its get_draw 
+    method, so passing the current timestep as 'key' reuses one coefficient 
+    draw for every evaluation within a timestep.
+    """
+    _links = {'logit': lambda eta: np.exp(-np.logaddexp(0, -eta)),
+              'cloglog': lambda eta: -np.expm1(-np.exp(eta)),
+              'identity': lambda eta: eta}
+
+    def __init__(self, coefficients, terms, link='logit'):
+        if link not in self._links:
+            raise ValueError("link must be one of %s"%", ".join(sorted(self._links.keys())))
+        self._coefficients = coefficients
+        self._link = link
+        self._terms = []
+        for coefficient_name, term in terms:
+            if term == None:
+                term = ()
+            elif isinstance(term, basestring):
+                term = (term,)
+            else:
+                term = tuple(term)
+            self._terms.append((coefficient_name, term))
+        # The positions of the coefficients of each term in the coefficient 
+        # vectors drawn by the Coefficient_Set.
+        self._positions = np.array([coefficients.get_position(name) for name, 
+            term in self._terms], dtype=int)
+
+    @classmethod
+    def from_rc_params(cls, rcParams, terms, link='logit', covariance_key=None):
+        """
+        Builds a Linear_Predictor whose coefficient names are rc parameter 
+        keys of (coef, stderror) tuples, with a Coefficient_Set built by 
+        Coefficient_Set.from_rc_params.
+        """
+        keys = []
+        for key, term in terms:
+            if key not in keys:
+                keys.append(key)
+        return cls(Coefficient_Set.from_rc_params(rcParams, keys, 
+            covariance_key), terms, link)
+
+    def get_coefficients(self):
+        return self._coefficients
+
+    def get_terms(self):
+        return list(self._terms)
+
+    def design_matrix(self, columns, num_agents=None):
+        """
+        Returns the design matrix for the agents in columns, with one row per 
+        agent and one column per term. num_agents is only needed if the 
+        predictor has no column terms (only an intercept).
+        """
+        cache = {}
+        for coefficient_name, term in self._terms:
+            for name in term:
+                if name not in cache:
+                    cache[name] = _get_column(columns, name)
+                    if num_agents == None:
+                        num_agents = len(cache[name])
+        if num_agents == None:
+            raise ValueError("num_agents must be given for a predictor without column terms")
+        matrix = np.empty((num_agents, len(self._terms)))
+        for n, (coefficient_name, term) in enumerate(self._terms):
+            if len(term) == 0:
+                matrix[:, n] = 1
+            else:
+                matrix[:, n] = cache[term[0]]
+                for name in term[1:]:
+                    matrix[:, n] *= cache[name]
+        return matrix
+
+    def linear_predictor(self, columns, key=None, rng=None, num_agents=None):
+        """
+        Returns the linear predictor for each agent, using the coefficients 
+        from get_draw(key, rng) of the Coefficient_Set.
+        """
+        coefficients = self._coefficients.get_draw(key, rng)[self._positions]
+        return np.dot(self.design_matrix(columns, num_agents), coefficients)
+
+    def probabilities(self, columns, key=None, rng=None, num_agents=None):
+        """
+        Returns the probability for each agent (the inverse link function of 
+        the linear predictor).
+        """
+        return self._links[self._link](self.linear_predictor(columns, key, rng, 
+            num_agents))
+
+    def draw_events(self, columns, key=None, rng=None, num_agents=None):
+        """
+        Returns a boolean array that is True for each agent that experiences 
+        the event, drawn with boolean_choices from the probabilities. rng is 
+        used both for any new coefficient draw and for the event draws.
+        """
+        return boolean_choices(self.probabilities(columns, key, rng, 
+            num_agents), rng=rng)
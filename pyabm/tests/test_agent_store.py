@@ -0,0 +1,118 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+
+"""
+Tests for the Agent_Store class.
+"""
+
+from nose.tools import assert_equal
+
+from pyabm.agents import Agent, Agent_set, Agent_Store
+
+class Person(Agent):
+    def __init__(self, world, ID):
+        Agent.__init__(self, world, ID)
+        self._store_list = []
+
+def make_neighborhoods():
+    """
+    Returns two neighborhoods (IDs 100 and 200), each with two households, 
+    each with three people, and a list of the people.
+    """
+    people = []
+    neighborhoods = []
+    next_ID = 0
+    for neighborhood_ID in (100, 200):
+        neighborhood = Agent_set(None, neighborhood_ID, True)
+        for household_ID in (neighborhood_ID + 1, neighborhood_ID + 2):
+            household = Agent_set(None, household_ID, True)
+            members = [Person(None, ID) for ID in xrange(next_ID, next_ID + 3)]
+            next_ID += 3
+            household.add_agents(members)
+            neighborhood.add_agent(household)
+            people.extend(members)
+        neighborhoods.append(neighborhood)
+    return neighborhoods, people
+
+def test_release_agents():
+    neighborhoods, people = make_neighborhoods()
+    store = Agent_Store()
+    household = people[0].get_parent_agent()
+    store.add_agent(people[0], 5)
+    store.add_agent(people[1], 5)
+    store.add_agent(people[2], 6)
+    assert_equal(store.num_stored(), 3)
+    assert_equal(household.num_members(), 0)
+    assert_equal(store.release_agents(4), ({}, []))
+    released_dict, released = store.release_agents(5)
+    assert_equal(released_dict, {100: 2})
+    assert_equal(released, people[:2])
+    assert_equal(household.num_members(), 2)
+    for person in released:
+        assert_equal(person.get_parent_agent(), household)
+        assert not store.in_store(person)
+        assert_equal(person._store_list, [])
+    assert store.in_store(people[2])
+    assert_equal(store.num_stored(), 1)
+
+def test_release_until():
+    neighborhoods, people = make_neighborhoods()
+    store = Agent_Store()
+    store.add_agent(people[0], 7)
+    store.add_agent(people[1], 3)
+    store.add_agent(people[2], 5)
+    store.add_agent(people[3], 9)
+    released_dict, released = store.release_until(7)
+    # Agents are released in order of release time.
+    assert_equal(released, [people[1], people[2], people[0]])
+    assert_equal(released_dict, {100: 3})
+    assert_equal(store.peek_next_release(), 9)
+    assert_equal(store.release_until(8), ({}, []))
+    assert_equal(store.num_stored(), 1)
+
+def test_peek_next_release_after_remove_agent_empties_timestep():
+    neighborhoods, people = make_neighborhoods()
+    store = Agent_Store()
+    store.add_agent(people[0], 3)
+    store.add_agent(people[1], 5)
+    assert_equal(store.peek_next_release(), 3)
+    store.remove_agent(people[0])
+    assert not store.in_store(people[0])
+    assert_equal(people[0]._store_list, [])
+    assert_equal(store.peek_next_release(), 5)
+    assert_equal(store.release_agents(3), ({}, []))
+    store.remove_agent(people[1])
+    assert_equal(store.peek_next_release(), None)
+    assert_equal(store.num_stored(), 0)
+
+def test_counts_by_ancestor():
+    neighborhoods, people = make_neighborhoods()
+    # people[0:3] are in household 101, people[3:6] in household 102 (both 
+    # in neighborhood 100), people[6:9] in household 201 and people[9:12] in 
+    # household 202 (both in neighborhood 200).
+    by_household = Agent_Store(count_level=1)
+    by_neighborhood = Agent_Store()
+    for person in people[0:2] + people[3:4] + people[6:7]:
+        by_household.add_agent(person, 1)
+    for person in people[4:5] + people[9:12]:
+        by_neighborhood.add_agent(person, 1)
+    released_dict, released = by_household.release_agents(1)
+    assert_equal(released_dict, {101: 2, 102: 1, 201: 1})
+    released_dict, released = by_neighborhood.release_agents(1)
+    assert_equal(released_dict, {100: 1, 200: 3})
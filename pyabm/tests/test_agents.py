@@ -0,0 +1,107 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for the agents module.
+"""
+
+from nose.tools import assert_equal, assert_raises
+
+from pyabm import np
+from pyabm.agents import Agent, Agent_set, Column_Agent, Column_Store, column_property
+
+class Person(Column_Agent):
+    __slots__ = ()
+    _columns = ('age',)
+    age = column_property('age')
+
+def make_household(ages):
+    store = Column_Store({'age': np.float64})
+    household = Agent_set(None, 100, True, column_store=store)
+    household.track_aggregate('tot', 'age')
+    household.add_index('age', bins=[0, 20, 40, 60])
+    people = [Person(None, ID, True, age=age) for ID, age in enumerate(ages)]
+    household.add_agents(people)
+    return household, store, people
+
+def test_column_setter_updates_index_and_aggregate():
+    household, store, people = make_household([10., 20.])
+    people[0].age = 30.
+    assert_equal(household.query(age=(20, 40)), people)
+    assert_equal(household.get_aggregate('tot'), 50.)
+    people[1].set_attribute('age', 45.)
+    assert_equal(household.query(age=(40, 60)), [people[1]])
+    assert_equal(household.get_aggregate('tot'), 75.)
+    household.remove_agent(people[0])
+    assert_equal(household.get_aggregate('tot'), 45.)
+
+def test_reindex_after_column_update():
+    household, store, people = make_household([10., 20.])
+    ages = store.get_column('age')
+    ages += 10
+    household.reindex()
+    assert_equal(household.query(age=(20, 40)), people)
+    assert_equal(household.get_aggregate('tot'), 50.)
+
+def test_failed_batch_leaves_set_untouched():
+    household = Agent_set(None, 100, True)
+    household.track_aggregate('population')
+    household.track_aggregate('income', '_income')
+    household.add_index('_sex')
+    people = [Agent(None, ID) for ID in xrange(3)]
+    for person in people:
+        person._sex = 'female'
+        person._income = 10
+    household.add_agents(people[:1])
+    # people[2] is missing the indexed attribute
+    del people[2]._sex
+    assert_raises(AttributeError, household.add_agents, people[1:])
+    assert_raises(AttributeError, household.add_agent, people[2])
+    assert_equal(household.get_agents(), people[:1])
+    assert not household.is_member(1)
+    assert_equal(household.get_aggregate('population'), 1)
+    assert_equal(household.get_aggregate('income'), 10)
+    assert_equal(household.query(_sex='female'), people[:1])
+    assert_equal(people[1].get_parent_agent(), None)
+    people[2]._sex = 'male'
+    household.add_agents(people[1:])
+    assert_equal(household.query(_sex='male'), people[2:])
+    assert_equal(household.get_aggregate('income'), 30)
+
+def test_set_attribute_new_attribute_with_count_aggregate():
+    household = Agent_set(None, 100, True)
+    household.track_aggregate('population')
+    person = Agent(None, 1)
+    household.add_agent(person)
+    # The count aggregate does not need the (missing) old value.
+    person.set_attribute('_income', 10)
+    assert_equal(person._income, 10)
+    assert_equal(household.get_aggregate('population'), 1)
+
+def test_member_lookup_after_compaction():
+    household = Agent_set(None, 100, True)
+    people = [Agent(None, ID) for ID in xrange(10)]
+    household.add_agents(people)
+    household.remove_agents(range(7))
+    for person in people[7:]:
+        assert_equal(household.get_agent(person.get_ID()), person)
+    assert_equal(household.get_agents(), people[7:])
+    assert_equal(household.query(), people[7:])
+    household.add_agent(people[0])
+    assert_equal(household.get_agent(0), people[0])
+    assert_equal(household.get_agents(), people[7:] + people[:1])
@@ -0,0 +1,133 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for the checkpoint module.
+"""
+
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal
+
+from pyabm import np
+from pyabm import random_streams
+from pyabm.agents import Agent_set, Agent_Store, Column_Agent, Column_Store, \
+        column_property
+from pyabm.checkpoint import save_checkpoint, load_checkpoint
+
+class Person(Column_Agent):
+    __slots__ = ()
+    _columns = ('age',)
+    age = column_property('age')
+
+class Migrant(Person):
+    __slots__ = ('_store_list',)
+    def __init__(self, world, ID, initial_agent=False, **values):
+        Person.__init__(self, world, ID, initial_agent, **values)
+        self._store_list = []
+
+def make_run(num_households, household_size):
+    store = Column_Store({'age': np.float64})
+    neighborhood = Agent_set(None, 0, True)
+    neighborhood.track_aggregate('tot_age', 'age')
+    ID = num_households + 1
+    for household_ID in xrange(1, num_households + 1):
+        household = Agent_set(None, household_ID, True, column_store=store)
+        household.track_aggregate('tot_age', 'age')
+        household.add_agents([Migrant(None, ID + n, True, age=20) for n in 
+            xrange(household_size)])
+        ID += household_size
+        neighborhood.add_agent(household)
+    return neighborhood, Agent_Store(count_level=1)
+
+def run_step(neighborhood, migrants, timestep):
+    """
+    Runs one timestep of a small model drawing from both numpy.random and a 
+    random_streams stream, and returns a list of what happened.
+    """
+    events = []
+    migration_rng = random_streams.get_stream('migration')
+    released = migrants.release_agents(timestep)[1]
+    events.append([agent.get_ID() for agent in released])
+    for household in neighborhood.iter_agents_shuffled():
+        for person in list(household.iter_agents_shuffled()):
+            person.age += np.random.random()
+            if migration_rng.random_sample() < .2:
+                migrants.add_agent(person, timestep + 
+                        migration_rng.randint(1, 4))
+                events.append(person.get_ID())
+    events.append(neighborhood.get_aggregate('tot_age'))
+    return events
+
+def test_resumed_run_is_bit_identical():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, 'run.checkpoint')
+        np.random.seed(1)
+        random_streams.seed_streams(1)
+        neighborhood, migrants = make_run(5, 4)
+        for timestep in xrange(5):
+            run_step(neighborhood, migrants, timestep)
+        save_checkpoint(filename, [neighborhood], stores=[migrants])
+        expected = [run_step(neighborhood, migrants, timestep) for timestep 
+                in xrange(5, 10)]
+
+        # Reseed, so the resumed run only matches if the checkpoint restores 
+        # the random number generator states.
+        np.random.seed(2)
+        random_streams.seed_streams(2)
+        checkpoint = load_checkpoint(filename)
+        neighborhood = checkpoint['roots'][0]
+        migrants = checkpoint['stores'][0]
+        resumed = [run_step(neighborhood, migrants, timestep) for timestep 
+                in xrange(5, 10)]
+        assert_equal(resumed, expected)
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_resave_to_loaded_checkpoint():
+    # Enough agents that the age column is memory-mapped when loaded.
+    num_agents = 2000
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, 'run.checkpoint')
+        store = Column_Store({'age': np.float64})
+        household = Agent_set(None, num_agents, True, column_store=store)
+        household.add_agents([Person(None, ID, True, age=ID) for ID in 
+            xrange(num_agents)])
+        save_checkpoint(filename, [household])
+
+        household = load_checkpoint(filename)['roots'][0]
+        store = household.get_column_store()
+        assert isinstance(store.get_column('age').base, np.memmap)
+        store.get_column('age')[:] += 1
+        # Saving over the file the columns are mapped from must not 
+        # invalidate them.
+        save_checkpoint(filename, [household])
+        assert_equal(store.get_column('age').sum(), 
+                np.arange(1, num_agents + 1).sum())
+
+        household = load_checkpoint(filename)['roots'][0]
+        ages = household.get_column('age')
+        assert_equal(list(ages[:3]), [1., 2., 3.])
+        assert_equal(ages.sum(), np.arange(1, num_agents + 1).sum())
+        assert_equal(os.listdir(temp_dir), ['run.checkpoint'])
+    finally:
+        shutil.rmtree(temp_dir)
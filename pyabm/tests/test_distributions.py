@@ -0,0 +1,42 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for the distributions module.
+"""
+
+import cPickle
+
+from nose.tools import assert_equal, assert_raises
+
+from pyabm import np
+from pyabm.distributions import Probability_Table
+from pyabm.rcsetup import validate_probability
+
+def test_probability_table_matches_dictionary():
+    table = validate_probability(0, 10)("{(0, 2): .6, (2, 5): .9, (7, 8): .1}")
+    expected = {0: .6, 1: .6, 2: .9, 3: .9, 4: .9, 7: .1}
+    assert isinstance(table, Probability_Table)
+    assert_equal(table, expected)
+    assert_equal(table[3], .9)
+    assert_raises(KeyError, table.__getitem__, 5)
+    assert_raises(TypeError, table.__setitem__, 5, .5)
+    assert_equal(str(table), "{(0, 2): 0.6, (2, 5): 0.9, (7, 8): 0.1}")
+    assert_equal(cPickle.loads(cPickle.dumps(table, 2)), expected)
+    assert_equal(list(table.lookup(np.array([0, 4, 7]))), [.6, .9, .1])
+    assert_raises(KeyError, table.lookup, np.array([5]))
@@ -0,0 +1,58 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for the forking module.
+"""
+
+import os
+import time
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_equal, assert_raises
+
+from pyabm import rc_params
+from pyabm.forking import ForkError, _clone_runs, _fork_runs
+
+def test_clone_runs_restores_original_values():
+    rcParams = rc_params.get_params()
+    seed = rcParams['random_seed']
+    original_seed = rcParams.original_value['random_seed']
+    def run_function(state, child_num):
+        return rcParams['random_seed']
+    results = _clone_runs(None, run_function, [{'random_seed': seed + 1}, 
+        {'random_seed': seed + 2}])
+    assert_equal(results, [seed + 1, seed + 2])
+    assert_equal(rcParams.original_value['random_seed'], original_seed)
+    # Revalidating the parameters must not bring back the overrides.
+    rcParams.validate_items()
+    assert_equal(rcParams['random_seed'], seed)
+
+def test_failed_fork_run_stops_other_scenarios():
+    if not hasattr(os, 'fork'):
+        raise SkipTest("os.fork is not available")
+    def run_function(state, child_num):
+        if child_num == 0:
+            raise ValueError("scenario failed")
+        time.sleep(60)
+    start = time.time()
+    assert_raises(ForkError, _fork_runs, None, run_function, [{}, {}, {}], 3)
+    assert time.time() - start < 30
+    # The scenarios still running when the first failed must have been 
+    # stopped and reaped.
+    assert_raises(OSError, os.waitpid, -1, os.WNOHANG)
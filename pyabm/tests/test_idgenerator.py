@@ -0,0 +1,51 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for IDGenerator and IDPartition.
+"""
+
+from nose.tools import assert_raises, assert_equal
+
+from pyabm import IDGenerator, IDError
+
+def test_merge_collision_leaves_generator_unchanged():
+    generator = IDGenerator()
+    generator.reserve_block(3)
+    partitions = generator.partition(2)
+    first_IDs = partitions[0].reserve_block(2)
+    # Merging the first partition twice collides on its own IDs.
+    assert_raises(IDError, generator.merge, [partitions[0], partitions[1], 
+        partitions[0]])
+    assert_equal(generator.num_used(), 3)
+    assert not generator.is_used(first_IDs[0])
+    # The generator is still partitioned, and a corrected merge succeeds.
+    assert_raises(IDError, generator.next)
+    generator.merge(partitions)
+    assert_equal(generator.num_used(), 5)
+    assert generator.next() not in first_IDs
+
+def test_use_ID_rejected_in_partitioned_space():
+    generator = IDGenerator()
+    generator.reserve_block(3)
+    partitions = generator.partition(2)
+    assert_raises(IDError, generator.use_ID, 3)
+    partitions[0].next()
+    generator.merge(partitions)
+    assert generator.is_used(3)
+    assert not generator.is_used(4)
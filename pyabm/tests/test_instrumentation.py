@@ -0,0 +1,56 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for the instrumentation module.
+"""
+
+from nose.tools import assert_equal
+
+from pyabm.agents import Agent, Agent_set, Agent_Store
+from pyabm.utility import TimeSteps
+from pyabm import instrumentation
+
+class Person(Agent):
+    def __init__(self, world, ID):
+        Agent.__init__(self, world, ID)
+        self._store_list = []
+
+def test_occupancy_summed_over_stores_and_carried_forward():
+    time_steps = TimeSteps([[2000, 1], [2001, 1]], 1)
+    counters = instrumentation.enable_lifecycle_counters(time_steps)
+    try:
+        household = Agent_set(None, 1000, True)
+        people = [Person(None, ID) for ID in xrange(16)]
+        household.add_agents(people)
+        migrants = Agent_Store()
+        students = Agent_Store()
+        row = time_steps.get_cur_int_timestep()
+        for person in people[:15]:
+            migrants.add_agent(person, row + 5)
+        students.add_agent(people[15], row + 5)
+        assert_equal(counters.get_occupancy('Agent_Store')[row], 16)
+        # No store operations in the next two timesteps.
+        time_steps.increment()
+        time_steps.increment()
+        assert_equal(list(counters.get_occupancy('Agent_Store')[row:row + 3]), 
+                [16, 16, 16])
+        migrants.remove_agent(people[0])
+        assert_equal(counters.get_occupancy('Agent_Store')[row + 2], 15)
+    finally:
+        instrumentation.disable_lifecycle_counters()
@@ -0,0 +1,38 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for the statistics module.
+"""
+
+from nose.tools import assert_equal, assert_raises
+
+from pyabm.distributions import Prob_Dist
+from pyabm.statistics import calc_prob_from_prob_dist
+
+def test_calc_prob_from_prob_dist_matches_tuple_form():
+    prob_dist_tuple = ([0, 1, 3, 3, 3.5, 10], [1, 0, 5, 2, 1])
+    prob_dist = Prob_Dist(*prob_dist_tuple)
+    for attribute in [-1, 0, .5, 1, 2, 3, 3.2, 3.5, 9, 10]:
+        assert_equal(calc_prob_from_prob_dist(prob_dist, attribute), 
+                calc_prob_from_prob_dist(prob_dist_tuple, attribute))
+    for attribute in [11, float('nan')]:
+        assert_raises(IndexError, calc_prob_from_prob_dist, prob_dist_tuple, 
+                attribute)
+        assert_raises(IndexError, calc_prob_from_prob_dist, prob_dist, 
+                attribute)
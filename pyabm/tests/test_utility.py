@@ -0,0 +1,57 @@
+# Copyright 2009-2013 Alex Zvoleff
+#
+# This file is part of the pyabm agent-based modeling toolkit.
+# 
+# pyabm is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+# 
+# pyabm is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# pyabm.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See the README.rst file for author contact information.
+
+"""
+Tests for the utility module.
+"""
+
+from nose.tools import assert_equal
+
+from pyabm.utility import Event_Scheduler
+
+def test_cancel_event_due_at_same_time():
+    scheduler = Event_Scheduler()
+    calls = []
+    def die(agent):
+        calls.append(('die', agent))
+        scheduler.cancel(return_migration)
+    scheduler.schedule(5, die, 'person')
+    return_migration = scheduler.schedule(5, calls.append, ('return', 
+        'person'))
+    assert_equal(len(scheduler), 2)
+    assert_equal(scheduler.dispatch(5), 1)
+    assert_equal(calls, [('die', 'person')])
+    assert return_migration.cancelled
+    assert not return_migration.dispatched
+    assert_equal(len(scheduler), 0)
+
+def test_dispatched_event_is_not_cancelled():
+    scheduler = Event_Scheduler()
+    calls = []
+    event = scheduler.schedule(3, calls.append, 1)
+    # An event scheduled by a callback for the current time is also 
+    # dispatched.
+    scheduler.schedule(3, lambda: scheduler.schedule(3, calls.append, 2))
+    assert_equal(scheduler.dispatch(4), 3)
+    assert_equal(calls, [1, 2])
+    assert event.dispatched
+    assert not event.cancelled
+    # Cancelling a dispatched event does not change the pending count.
+    scheduler.cancel(event)
+    assert not event.cancelled
+    assert_equal(len(scheduler), 0)
@@ -25,6 +25,7 @@ agent-based models.
 
 import sys
 import os
+import heapq
 import logging
 import tempfile
 import subprocess
@@ -137,6 +138,150 @@ class TimeSteps():
     def __str__(self):
         return "%s-%s"%(self._year, self._month)
 
+class Event(object):
+    """
+    A handle for an event scheduled with an Event_Scheduler. Can be used to 
+    cancel the event before it is dispatched. The cancelled and dispatched 
+    attributes record whether the event was cancelled, or has been removed 
+    from the scheduler to be called.
+    """
+    __slots__ = ('time', 'callback', 'args', 'cancelled', 'dispatched')
+
+    def __init__(self, time, callback, args):
+        self.time = time
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.dispatched = False
+
+    def __call__(self):
+        return self.callback(*self.args)
+
+class Event_Scheduler(object):
+    """
+    Schedules events (a callback, and arguments to call it with) to be 
+    dispatched at a later integer timestep of a model run (as returned by 
+    TimeSteps.get_cur_int_timestep). Events are kept in a priority queue, so 
+    only the events that are due are examined each timestep. Events due at 
+    the same timestep are dispatched in the order they were scheduled.
+
+    For example, to have a household dissolve in 12 timesteps::
+
+        event = scheduler.schedule_in(12, household.dissolve)
+
+    and, if the household dissolves early for some other reason::
+
+        scheduler.cancel(event)
+    """
+    def __init__(self, time_steps=None):
+        self._time_steps = time_steps
+        # _queue is a heap of (time, sequence number, event) tuples. Cancelled 
+        # events are left in the heap, and skipped when they reach the top.
+        self._queue = []
+        self._sequence = 0
+        self._num_pending = 0
+
+    def _get_time(self, time):
+        if time == None:
+            if self._time_steps == None:
+                raise ValueError("a time must be given when the Event_Scheduler has no TimeSteps instance")
+            time = self._time_steps.get_cur_int_timestep()
+        return time
+
+    def schedule(self, time, callback, *args):
+        """
+        Schedules callback(*args) to be called at the given integer timestep.  
+        Returns an Event handle that can be used to cancel the event.
+        """
+        event = Event(time, callback, args)
+        heapq.heappush(self._queue, (time, self._sequence, event))
+        self._sequence += 1
+        self._num_pending += 1
+        return event
+
+    def schedule_in(self, delay, callback, *args):
+        """
+        Schedules callback(*args) to be called 'delay' timesteps after the 
+        current timestep of the scheduler's TimeSteps instance.
+        """
+        return self.schedule(self._get_time(None) + delay, callback, *args)
+
+    def cancel(self, event):
+        """
+        Cancels a scheduled event. Has no effect if the event has already been 
+        dispatched (or cancelled).
+        """
+        if not event.cancelled and not event.dispatched:
+            event.cancelled = True
+            self._num_pending -= 1
+
+    def _discard_cancelled(self):
+        queue = self._queue
+        while queue and queue[0][2].cancelled:
+            heapq.heappop(queue)
+
+    def peek_next_time(self):
+        "Returns the time of the next pending event, or None if there are none."
+        self._discard_cancelled()
+        if self._queue:
+            return self._queue[0][0]
+        else:
+            return None
+
+    def pop_due(self, time=None):
+        """
+        Removes and returns a list of the events due at or before 'time' 
+        (which defaults to the current timestep of the scheduler's TimeSteps 
+        instance), without calling them.
+        """
+        time = self._get_time(time)
+        events = []
+        while True:
+            event = self._pop_next_due(time)
+            if event == None:
+                break
+            events.append(event)
+        return events
+
+    def _pop_next_due(self, time):
+        """
+        Removes and returns the next event due at or before 'time', or returns 
+        None if no events are due.
+        """
+        self._discard_cancelled()
+        queue = self._queue
+        if not queue or queue[0][0] > time:
+            return None
+        event = heapq.heappop(queue)[2]
+        event.dispatched = True
+        self._num_pending -= 1
+        return event
+
+    def dispatch(self, time=None):
+        """
+        Calls all the events due at or before 'time' (which defaults to the 
+        current timestep of the scheduler's TimeSteps instance). Events that 
+        are scheduled for the current time by the callbacks themselves are 
+        also dispatched. Returns the number of events dispatched.
+
+        The events are removed from the queue and called one at a time, so an 
+        event cancelled by the callback of an earlier event due at the same 
+        time (when an agent dies before its scheduled return migration, for 
+        example) is not called.
+        """
+        time = self._get_time(time)
+        num_dispatched = 0
+        while True:
+            event = self._pop_next_due(time)
+            if event == None:
+                break
+            event()
+            num_dispatched += 1
+        return num_dispatched
+
+    def __len__(self):
+        return self._num_pending
+
 def email_logfile(log_file, subject='pyabm Log'):
     msg = MIMEMultipart()
     msg['Subject'] = subject
@@ -8,7 +8,7 @@ from setuptools import setup, find_packages
 setup(
     name = 'pyabm',
     version = '0.4dev',
-    packages = ['pyabm'],
+    packages = ['pyabm', 'pyabm.tests'],
     package_dir = {'pyabm' : 'pyabm'},
     package_data = {'pyabm' : ['rcparams.default',
                                'pyabmrc.windows',